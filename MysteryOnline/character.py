@@ -1,9 +1,13 @@
 from kivy.config import ConfigParser
 from kivy.atlas import Atlas
 from kivy.logger import Logger
-from MysteryOnline.icarus import Icarus
+from MysteryOnline.icarus import Icarus, page_cache
+from MysteryOnline.sprite import NSFW, SPOILER, CG
 from kivy.app import App
 from MysteryOnline.mopopup import MOPopup
+from MysteryOnline import metadata_index
+from collections.abc import MutableMapping
+import json
 import os
 
 
@@ -11,9 +15,107 @@ main_series_list = ["OC"]
 extra_series_list = []
 
 
+whitelist_cache = None  # (modification time of mysteryonline.ini, whitelisted series)
+
+
+def get_whitelisted_series():
+    """Series the user has read, None when the setting is missing. Only re-read when the ini changes."""
+    global whitelist_cache
+    mtime = get_mtime('mysteryonline.ini')
+    if whitelist_cache is not None and whitelist_cache[0] == mtime:
+        return whitelist_cache[1]
+    config = ConfigParser()
+    config.read('mysteryonline.ini')
+    try:
+        whitelist = parse_whitelist(config.get('other', 'whitelisted_series'))
+    except:
+        whitelist = None
+    whitelist_cache = mtime, whitelist
+    return whitelist
+
+
+def parse_whitelist(value):
+    whitelist = str(value).strip('[]')
+    whitelist = whitelist.replace("'", "")
+    return [x.strip() for x in whitelist.split(',')]
+
+
+def on_sprite_config_change(section, key, value):
+    """Config callback for the settings the display class of a sprite depends on."""
+    global whitelist_cache
+    if key == 'whitelisted_series':
+        # The ini isn't written yet when the callback runs, it's read again once its time changes
+        whitelist_cache = get_mtime('mysteryonline.ini'), parse_whitelist(value)
+    for char in characters.loaded.values():
+        char.reclassify_sprites(key == 'whitelisted_series')
+
+
+def register_series(series):
+    if series[0] not in main_series_list:
+        main_series_list.append(series[0])
+    for s in series[1:]:
+        if s not in extra_series_list:
+            extra_series_list.append(s)
+
+
+def get_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_mtimes(path, sprites):
+    """Modification times of the files an index entry is made from."""
+    return [get_mtime(path + "settings.ini"), get_mtime(path + sprites)]
+
+
+def read_atlas(filename):
+    try:
+        with open(filename, 'r') as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+
+def read_metadata(path):
+    """Parses the settings.ini and sprite atlas of a character into a plain dict that can be stored in the index."""
+    config = ConfigParser()
+    config.read(path + "settings.ini")
+    char = config['character']
+    series = [s.strip() for s in char['series'].split(',')]
+    try:
+        link = char['download']
+    except KeyError:
+        link = "no link"
+    try:
+        version = char['ver']
+    except KeyError:
+        try:
+            version = char['version']
+        except KeyError:
+            version = 0
+    try:
+        nsfw = config['nsfw']['sprites'].split(',')
+    except KeyError:
+        nsfw = []
+    try:
+        spoiler_section = config['spoiler']
+        spoiler = [spoiler_section[key].split(',') for key in sorted(spoiler_section)]
+    except KeyError:
+        spoiler = []
+    try:
+        cg = config['CG']['sprites'].split(',')
+    except KeyError:
+        cg = []
+    return {'mtime': get_mtimes(path, char['sprites']), 'name': char['name'], 'series': series,
+            'sprites': char['sprites'], 'icons': char['icons'], 'link': link, 'version': version,
+            'nsfw': nsfw, 'spoiler': spoiler, 'cg': cg, 'atlas': read_atlas(path + char['sprites'])}
+
+
 class Character:
 
-    def __init__(self, name):
+    def __init__(self, name, metadata=None):
         self.name = name
         self.path = "characters/{0}/".format(self.name)
         self.display_name = None
@@ -28,112 +130,59 @@ class Character:
         self.icons = None
         self.link = None
         self.version = None
+        self.atlas = None  # Contents of the sprite atlas, None if it has to be read from disk
         # Hash tables for faster membership checking
         self.nsfw_sprites = {}
         self.spoiler_sprites = {}
         self.cg_sprites = {}
+        self.spoiler_lists = []
+        # Sprite name -> display class, built on first use and dropped when the settings change
+        self.sprite_classes = None
         try:
-            self.config = ConfigParser(self.name)
-        except ValueError:
-            self.config = ConfigParser.get_configparser(self.name)
-        try:
-            self.read_config()
+            if metadata is None:
+                metadata = read_metadata(self.path)
+            self.apply_metadata(metadata)
         except (KeyError, AttributeError):
             Logger.exception('Problematic character located in: ' + self.path)
 
     def read_config(self):
-        global main_series_list
-        self.config.read(self.path + "settings.ini")
-        char = self.config['character']
-        self.display_name = char['name']
-        con_series = char['series']
-        con_series = con_series.split(',')
-        con_series = [s.strip() for s in con_series]
-        main_series = con_series[0]
-        if len(con_series) > 1:
-            extra_series = con_series[1:]
-            self.extra_series = extra_series
-        if main_series not in main_series_list:
-            main_series_list.append(main_series)
-        for s in self.extra_series:
-            if s not in extra_series_list:
-                extra_series_list.append(s)
-        self.series = main_series
-        self.sprites_path = self.path + char['sprites']
-        self.icons_path = self.path + char['icons']
-        self.avatar = self.path + "avatar.png"
-        self.read_nsfw_sprites()
-        self.read_spoiler_sprites()
-        self.read_cg_sprites()
-        try:
-            self.link = char['download']
-        except KeyError:
-            self.link = "no link"
-        try:
-            self.version = char['ver']
-        except KeyError:
-            try:
-                self.version = char['version']
-            except KeyError:
-                self.version = 0
+        self.apply_metadata(read_metadata(self.path))
 
-    def read_nsfw_sprites(self):
-        try:
-            nsfw_list = self.config['nsfw']['sprites']
-        except KeyError:
-            return
-        nsfw_list = nsfw_list.split(',')
-        for sprite_name in nsfw_list:
-            self.nsfw_sprites[sprite_name] = None
+    def apply_metadata(self, metadata):
+        series = metadata['series']
+        register_series(series)
+        self.display_name = metadata['name']
+        self.series = series[0]
+        self.extra_series = series[1:]
+        self.sprites_path = self.path + metadata['sprites']
+        self.icons_path = self.path + metadata['icons']
+        self.avatar = self.path + "avatar.png"
+        self.link = metadata['link']
+        self.version = metadata['version']
+        self.atlas = metadata['atlas']
+        self.nsfw_sprites = dict.fromkeys(metadata['nsfw'])
+        self.cg_sprites = dict.fromkeys(metadata['cg'])
+        self.spoiler_lists = metadata['spoiler']
+        self.read_spoiler_sprites(self.spoiler_lists)
+        self.sprite_classes = None
 
-    def read_spoiler_sprites(self):
-        try:
-            spoiler_section = self.config['spoiler']
-        except KeyError:
-            return
+    def read_spoiler_sprites(self, spoiler_lists):
+        whitelist = get_whitelisted_series()
         spoiler_list = []
-        series = self.extra_series[:]
-        series.insert(0, self.series)
-        config = ConfigParser()
-        config.read('mysteryonline.ini')
-        try:
-            whitelist = config.get('other', 'whitelisted_series')
-        except:
-            for key, s in zip(sorted(spoiler_section), series):
-                spoiler_sprites = spoiler_section[key].split(',')
-                spoiler_list.extend(spoiler_sprites)
-            for sprite_name in spoiler_list:
-                self.spoiler_sprites[sprite_name] = None
-            return
-        whitelist = whitelist.strip('[]')
-        whitelist = whitelist.replace("'", "")
-        whitelist = whitelist.split(',')
-        whitelist = [x.strip() for x in whitelist]
-        for key, s in zip(sorted(spoiler_section), series):
-            if s not in whitelist:
-                spoiler_sprites = spoiler_section[key].split(',')
+        for spoiler_sprites, s in zip(spoiler_lists, [self.series] + self.extra_series):
+            if whitelist is None or s not in whitelist:
                 spoiler_list.extend(spoiler_sprites)
-        for sprite_name in spoiler_list:
-            self.spoiler_sprites[sprite_name] = None
-
-    def read_cg_sprites(self):
-        try:
-            cg_list = self.config['CG']['sprites']
-        except KeyError:
-            return
-        cg_list = cg_list.split(',')
-        for sprite_name in cg_list:
-            self.cg_sprites[sprite_name] = None
+        self.spoiler_sprites = dict.fromkeys(spoiler_list)
 
     def get_display_name(self):
         return self.display_name
 
     def load(self):
         try:
-            if self.loaded_icons and self.loaded_sprites:
-                return
             if not self.loaded_sprites:
                 self.load_sprites()
+            # The local user's sprites are needed right away
+            self.sprites.asynchronous = False
             if not self.loaded_icons:
                 self.load_icons()
         except Exception as e:
@@ -145,13 +194,19 @@ class Character:
         self.icons = Atlas(self.icons_path)
         self.loaded_icons = True
 
-    def load_sprites(self):
-        self.sprites = Icarus(self.sprites_path)
+    def load_sprites(self, asynchronous=False):
+        self.sprites = Icarus(self.sprites_path, asynchronous, self.atlas)
+        self.sprites.bind(on_page_loaded=self.on_sprites_loaded)
         self.loaded_sprites = True
 
     def load_without_icons(self):
         if not self.loaded_sprites:
-            self.load_sprites()
+            self.load_sprites(asynchronous=True)
+
+    def on_sprites_loaded(self, sprites, page):
+        main_scr = App.get_running_app().get_main_screen()
+        if main_scr is not None:
+            main_scr.sprite_window.refresh_sub()
 
     def get_icons(self):
         try:
@@ -163,23 +218,145 @@ class Character:
     def get_sprite(self, sprite_name):
         try:
             sprite = self.sprites[sprite_name]
-            config = App.get_running_app().config
-            if config.getdefaultint('other', 'nsfw_mode', 1) and sprite_name in self.nsfw_sprites:
-                sprite.set_nsfw()
-            elif config.getdefaultint('other', 'spoiler_mode', 1) and sprite_name in self.spoiler_sprites:
-                sprite.set_spoiler()
-            elif sprite_name in self.cg_sprites:
-                sprite.set_cg()
-            else:
-                sprite.unset_nsfw()
-                sprite.unset_spoiler()
+            if self.sprite_classes is None:
+                self.classify_sprites()
+            display_class = self.sprite_classes.get(sprite_name)
+            if sprite.display_class != display_class:
+                sprite.set_display_class(display_class)
             return sprite
         except AttributeError:
             Logger.error("Sprites: The sprites aren't loaded into memory")
             raise
 
+    def classify_sprites(self):
+        config = App.get_running_app().config
+        classes = dict.fromkeys(self.cg_sprites, CG)
+        if config.getdefaultint('other', 'spoiler_mode', 1):
+            classes.update(dict.fromkeys(self.spoiler_sprites, SPOILER))
+        if config.getdefaultint('other', 'nsfw_mode', 1):
+            classes.update(dict.fromkeys(self.nsfw_sprites, NSFW))
+        self.sprite_classes = classes
+
+    def reclassify_sprites(self, whitelist_changed=False):
+        if whitelist_changed:
+            self.read_spoiler_sprites(self.spoiler_lists)
+        self.sprite_classes = None
+
     def get_spoiler_icons(self):
         return self.spoiler_sprites
 
 
-characters = {name: Character(name) for name in os.listdir("characters") if os.path.isdir("characters/" + name)}
+class CharacterRegistry(MutableMapping):
+    """Characters by folder name, only turned into Character objects when asked for.
+
+    The settings and sprite atlas of every character are kept in the metadata index,
+    they are read again only when their modification time changed.
+    """
+
+    def __init__(self, directory="characters", index_file=metadata_index.INDEX_FILE):
+        self.directory = directory
+        self.index_file = index_file
+        self.metadata = None  # Folder name -> metadata, None until the folder is scanned
+        self.loaded = {}
+
+    def scan(self):
+        index = metadata_index.load_index(self.index_file)
+        indexed = index.setdefault('characters', {})
+        self.metadata = {}
+        changed = False
+        for name in os.listdir(self.directory):
+            path = "{0}/{1}/".format(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            metadata = indexed.get(name)
+            if metadata is None or metadata['mtime'] != get_mtimes(path, metadata['sprites']):
+                try:
+                    metadata = read_metadata(path)
+                except (KeyError, AttributeError):
+                    # Left for Character to report
+                    self.metadata[name] = None
+                    continue
+                indexed[name] = metadata
+                changed = True
+            register_series(metadata['series'])
+            self.metadata[name] = metadata
+        for name in list(indexed):
+            if name not in self.metadata:
+                del indexed[name]
+                changed = True
+        if changed:
+            metadata_index.save_index(index, self.index_file)
+
+    def refresh(self):
+        """Scans the folder again, keeping the loaded characters that didn't change.
+
+        Returns the names of the characters that were added, removed or changed.
+        """
+        old = self.metadata or {}
+        self.scan()
+        changed = set()
+        for name in set(old) | set(self.metadata):
+            before, after = old.get(name), self.metadata.get(name)
+            if before is None or after is None or before['mtime'] != after['mtime']:
+                changed.add(name)
+        for name in changed:
+            char = self.loaded.pop(name, None)
+            if char is not None and char.loaded_sprites:
+                page_cache.discard(char.sprites)
+        return changed
+
+    def rebind(self, users, names):
+        """Points users still holding an old version of the named characters to the current one."""
+        for user in users:
+            char = user.get_char()
+            if char is None or char.name not in names or self.loaded.get(char.name) is char:
+                continue
+            new_char = self.get(char.name)
+            if new_char is None:
+                new_char = self['RedHerring']
+                user.set_current_sprite('4')
+            user.set_char(new_char)
+            new_char.load_without_icons()
+
+    def ensure_scanned(self):
+        if self.metadata is None:
+            self.scan()
+
+    def __getitem__(self, name):
+        self.ensure_scanned()
+        try:
+            return self.loaded[name]
+        except KeyError:
+            pass
+        char = Character(name, self.metadata[name])
+        self.loaded[name] = char
+        return char
+
+    def __setitem__(self, name, char):
+        self.ensure_scanned()
+        self.metadata.setdefault(name, None)
+        self.loaded[name] = char
+
+    def __delitem__(self, name):
+        self.ensure_scanned()
+        del self.metadata[name]
+        self.loaded.pop(name, None)
+
+    def __contains__(self, name):
+        self.ensure_scanned()
+        return name in self.metadata
+
+    def __iter__(self):
+        self.ensure_scanned()
+        return iter(list(self.metadata))
+
+    def __len__(self):
+        self.ensure_scanned()
+        return len(self.metadata)
+
+    def clear(self):
+        self.metadata = {}
+        self.loaded = {}
+
+
+characters = CharacterRegistry()
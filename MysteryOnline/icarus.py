@@ -1,14 +1,92 @@
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 # noinspection PyUnresolvedReferences
 from os.path import dirname, join
+from kivy.clock import mainthread
 from kivy.event import EventDispatcher
+from kivy.graphics.texture import Texture
 from kivy.logger import Logger
 from kivy.properties import AliasProperty, DictProperty
 from MysteryOnline.sprite import Sprite, NullSprite
+from MysteryOnline import sprite_cache
 import os
 
-# late import to prevent recursion
-CoreImage = None
+# Worker threads decoding the pages of asynchronous atlases
+decoder = None
+
+
+def get_decoder():
+    global decoder
+    if decoder is None:
+        decoder = ThreadPoolExecutor(max_workers=2, thread_name_prefix='Icarus')
+    return decoder
+
+
+def get_pinned_atlases():
+    """Sprite atlases of the characters standing in a sublocation, their pages are never evicted."""
+    from MysteryOnline.location import location_manager
+    pinned = set()
+    for location in location_manager.locations.values():
+        for sub in location.sublocations.values():
+            for user in sub.get_users():
+                char = user.get_char()
+                if char is not None and char.sprites is not None:
+                    pinned.add(char.sprites)
+    return pinned
+
+
+class PageCache:
+    """Decoded pages of every Icarus, least recently used first, kept within a memory budget."""
+
+    def __init__(self, budget=512 * 1024 * 1024, get_pinned=get_pinned_atlases):
+        self.budget = budget
+        self.get_pinned = get_pinned
+        self.pages = OrderedDict()  # (atlas, page) -> size in bytes
+        self.size = 0
+        self.evictions = 0
+
+    def set_budget(self, megabytes):
+        self.budget = int(megabytes) * 1024 * 1024
+        self.evict()
+
+    def add(self, atlas, page, texture):
+        if (atlas, page) in self.pages:
+            self.touch(atlas, page)
+            return
+        size = texture.width * texture.height * 4
+        self.pages[(atlas, page)] = size
+        self.size += size
+        # The page was just asked for, it stays even when it alone goes over the budget
+        self.evict(keep=(atlas, page))
+
+    def touch(self, atlas, page):
+        if (atlas, page) in self.pages:
+            self.pages.move_to_end((atlas, page))
+
+    def discard(self, atlas):
+        """Drops every page of an atlas that is no longer used."""
+        for key in [key for key in self.pages if key[0] is atlas]:
+            self.size -= self.pages.pop(key)
+            atlas.unload_page(key[1])
+
+    def evict(self, keep=None):
+        if self.size <= self.budget:
+            return
+        pinned = self.get_pinned()
+        for key in list(self.pages):
+            if self.size <= self.budget:
+                break
+            atlas, page = key
+            if atlas in pinned or key == keep:
+                continue
+            Logger.debug('Atlas: Evict <%s>' % page)
+            self.size -= self.pages.pop(key)
+            self.evictions += 1
+            atlas.unload_page(page)
+
+
+page_cache = PageCache()
 
 
 class Icarus(EventDispatcher):
@@ -16,18 +94,30 @@ class Icarus(EventDispatcher):
     """
 
     textures = DictProperty({})
+    __events__ = ('on_page_loaded',)
 
     def _get_filename(self):
         return self._filename
 
     filename = AliasProperty(_get_filename, None)
 
-    def __init__(self, filename):
+    def __init__(self, filename, asynchronous=False, meta=None):
         self._filename = filename
+        # Contents of the .atlas when the caller already has them
+        self.meta = meta
+        # Asynchronous atlases hand out NullSprites while their pages are decoded in the background
+        self.asynchronous = asynchronous
+        self.decoding = set()
+        # Sprite name -> (page filename, region), parsed from the .atlas once
+        self.index = None
+        # Page filename -> names of the sprites on it
+        self.pages = {}
         super(Icarus, self).__init__()
 
     def __getitem__(self, key):
         if key in self.textures:
+            if self.index is not None and key in self.index:
+                page_cache.touch(self, self.index[key][0])
             return self.textures[key]
         self.load(key)
         return self.textures[key]
@@ -35,54 +125,100 @@ class Icarus(EventDispatcher):
     def __contains__(self, item):
         return item in self.textures
 
-    def load(self, image_name):
-        # late import to prevent recursive import.
-        global CoreImage
-        if CoreImage is None:
-            from kivy.core.image import Image as CoreImage
+    def load_index(self):
+        self.index = {}
+        filename = self._filename.replace('/', os.sep)
+        meta = self.meta
+        if meta is None:
+            Logger.debug('Atlas: Load <%s>' % filename)
+            with open(filename, 'r') as fd:
+                meta = json.load(fd)
+        d = dirname(filename)
+        for sub, ids in meta.items():
+            page = join(d, sub)
+            self.pages[page] = list(ids)
+            for meta_id, meta_coords in ids.items():
+                self.index[meta_id] = (page, meta_coords)
 
+    def load(self, image_name):
         # must be a name finished by .atlas ?
-        filename = self._filename
         try:
-            assert(filename.endswith('.atlas'))
-            # noinspection PyUnresolvedReferences
-            filename = filename.replace('/', os.sep)
-
-            Logger.debug('Atlas: Load <%s>' % filename)
+            assert(self._filename.endswith('.atlas'))
         except AttributeError:
             self.textures[image_name] = NullSprite(image_name)
             return
 
-        try:
-            with open(filename, 'r') as fd:
-                meta = json.load(fd)
-        except FileNotFoundError:
-            self.textures[image_name] = NullSprite(image_name)
-            return
-        d = dirname(filename)
-        textures = {}
-        found = None
-        ids_found = None
-        for sub, ids in meta.items():
-            if image_name in ids:
-                found = sub
-                ids_found = ids
-        if found is None:
+        if self.index is None:
+            try:
+                self.load_index()
+            except FileNotFoundError:
+                self.textures[image_name] = NullSprite(image_name)
+                return
+        if image_name not in self.index:
             Logger.error('Icarus: ' + image_name + ' not found')
             # noinspection PyTypeChecker
             self.textures[image_name] = NullSprite(image_name)
             return
-        subfilename = join(d, found)
-        Logger.debug('Atlas: Load <%s>' % subfilename)
-
-        # load the image
-        ci = CoreImage(subfilename)
-        atlas_texture = ci.texture
-
-        # for all the uid, load the image, get the region, and put
-        # it in our dict.
-        for meta_id, meta_coords in ids_found.items():
-            x, y, w, h = meta_coords
-            textures[meta_id] = Sprite(meta_id, atlas_texture.get_region(*meta_coords))
-
-        self.textures = textures
+        page = self.index[image_name][0]
+        if self.asynchronous:
+            self.textures[image_name] = NullSprite(image_name)
+            self.decode_page(page)
+        else:
+            self.load_page(page)
+
+    def load_page(self, page):
+        """Decodes a page of the atlas and adds the sprites on it to the textures."""
+        Logger.debug('Atlas: Load <%s>' % page)
+        self.add_page(page, Texture.create_from_data(sprite_cache.load(page)))
+
+    def prefetch(self, image_name):
+        """Starts decoding the page of a sprite that isn't loaded yet, returns whether it did."""
+        if image_name in self.textures:
+            return False
+        if self.index is None:
+            try:
+                self.load_index()
+            except (AttributeError, FileNotFoundError):
+                return False
+        if image_name not in self.index:
+            return False
+        page = self.index[image_name][0]
+        if page in self.decoding:
+            return False
+        self.decode_page(page)
+        return True
+
+    def decode_page(self, page):
+        """Decodes a page on a worker thread, only the texture upload is left to the main thread."""
+        if page in self.decoding:
+            return
+        Logger.debug('Atlas: Decode <%s>' % page)
+        self.decoding.add(page)
+        future = get_decoder().submit(sprite_cache.load, page)
+        future.add_done_callback(lambda f: self.on_page_decoded(page, f))
+
+    @mainthread
+    def on_page_decoded(self, page, future):
+        self.decoding.discard(page)
+        try:
+            image_data = future.result()
+        except Exception:
+            Logger.exception('Icarus: Could not decode ' + page)
+            return
+        self.add_page(page, Texture.create_from_data(image_data))
+        self.dispatch('on_page_loaded', page)
+
+    def on_page_loaded(self, page):
+        pass
+
+    def add_page(self, page, atlas_texture):
+        # Sprites already handed out keep their flags, only missing ones are created
+        textures = {meta_id: Sprite(meta_id, atlas_texture.get_region(*self.index[meta_id][1]))
+                    for meta_id in self.pages[page] if not isinstance(self.textures.get(meta_id), Sprite)}
+        self.textures.update(textures)
+        page_cache.add(self, page, atlas_texture)
+
+    def unload_page(self, page):
+        """Forgets the sprites of a page, they get decoded again the next time they're asked for."""
+        for meta_id in self.pages[page]:
+            self.textures.pop(meta_id, None)
@@ -136,12 +136,9 @@ class IconsLayout(BoxLayout):
         if current:
             user_handler.set_current_sprite_name(sprite_name)
             sprite = user_handler.get_current_sprite()
-            setting = user_handler.get_current_sprite_option
         else:
             user_handler.set_chosen_sprite_name(sprite_name)
             sprite = user_handler.get_chosen_sprite()
-            setting = user_handler.get_chosen_sprite_option
-        sprite = main_scr.sprite_settings.apply_post_processing(sprite, setting)
         main_scr.sprite_preview.set_sprite(sprite)
         Clock.schedule_once(main_scr.refocus_text, 0.2)
         if self.current_icon is not None:
@@ -157,9 +154,7 @@ class IconsLayout(BoxLayout):
         char = main_scr.user.get_char()
         user_handler = App.get_running_app().get_user_handler()
         sprite_option = user_handler.get_chosen_sprite_option()
-        sprite = char.get_sprite(sprite_name)
-        main_scr.sprite_settings.apply_post_processing(sprite, sprite_option)
-        sprite_texture = char.get_sprite(sprite_name).get_texture()
+        sprite_texture = char.get_sprite(sprite_name).get_texture(sprite_option == 0)
         sprite_size = sprite_texture.size
         # Can't use absolute position so it uses a workaround
         hover_x = self.right / Window.width
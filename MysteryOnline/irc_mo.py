@@ -1,4 +1,10 @@
+import queue
+import random
+import threading
+import time
 import traceback
+from collections import deque
+from functools import partial
 
 import irc.client
 from MysteryOnline.mopopup import MOPopup
@@ -10,7 +16,7 @@ from kivy.core.window import Window
 from kivy.utils import platform
 
 from MysteryOnline.character import characters
-from MysteryOnline.user import User
+from MysteryOnline.user import User, presence
 from MysteryOnline.choice import ChoicePopup
 import re
 
@@ -19,6 +25,100 @@ from MysteryOnline.user import CurrentUserHandler
 from jaraco.stream import buffer
 
 
+IRC_LINE_BYTES = 512
+# Room for the ':nick!user@host ' the server puts in front of a line when relaying it
+SOURCE_RESERVE = 100
+MAX_FRAGMENTS = 99
+FRAGMENT_HEADER = re.compile(r'\[(\d{1,2})/(\d{1,2})\] ')
+FRAGMENT_HEADER_BYTES = len("[99/99] ")
+
+
+def split_utf8(text, limit):
+    """Cuts text into pieces of at most limit UTF-8 bytes, preferably after a space."""
+    data = text.encode('utf-8')
+    pieces = []
+    start = 0
+    while len(data) - start > limit:
+        end = start + limit
+        while data[end] & 0xC0 == 0x80:  # Don't cut a character in half
+            end -= 1
+        space = data.rfind(b' ', start, end)
+        if space > start + limit // 2:
+            end = space + 1
+        pieces.append(data[start:end].decode('utf-8'))
+        start = end
+    pieces.append(data[start:].decode('utf-8'))
+    return pieces
+
+
+def frame(text, limit):
+    """Returns text as it fits in limit bytes, numbering the pieces '[i/n] ' if it has to be split.
+
+    Clients that don't reassemble fragments still show the numbered pieces one after another.
+    """
+    if len(text.encode('utf-8')) <= limit:
+        return [text]
+    pieces = split_utf8(text, limit - FRAGMENT_HEADER_BYTES)[:MAX_FRAGMENTS]
+    return ["[{}/{}] {}".format(i, len(pieces), piece) for i, piece in enumerate(pieces, 1)]
+
+
+class PendingFragments:
+
+    def __init__(self, total, deadline, message):
+        self.total = total
+        self.deadline = deadline
+        self.message = message
+        self.parts = {}
+
+    def get_text(self):
+        return ''.join(self.parts[i] for i in sorted(self.parts))
+
+
+# Stands in for the prefix in the key of private message fragments, chat has no prefix either
+PRIVATE_FRAGMENTS = 'PM'
+
+
+def get_fragment_key(sender, message=None):
+    """Fragments are put together per sender and message type, private messages (no message) apart."""
+    return sender, PRIVATE_FRAGMENTS if message is None else message.prefix
+
+
+class FragmentAssembler:
+    """Puts framed texts back together, giving up on the missing pieces after a timeout."""
+
+    def __init__(self, timeout=5.0, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.pending = {}
+
+    def feed(self, key, text, message=None):
+        """Returns (text, message) once the text is whole, None while pieces are missing."""
+        match = FRAGMENT_HEADER.match(text)
+        if match is None:
+            return text, message
+        index, total = int(match.group(1)), int(match.group(2))
+        if total < 2 or not 1 <= index <= total:
+            return text, message
+        fragments = self.pending.get(key)
+        if fragments is None or fragments.total != total or index in fragments.parts:
+            fragments = PendingFragments(total, self.clock() + self.timeout, message)
+            self.pending[key] = fragments
+        fragments.parts[index] = text[match.end():]
+        if len(fragments.parts) < total:
+            return None
+        del self.pending[key]
+        return fragments.get_text(), fragments.message
+
+    def expire(self):
+        """Returns (key, text, message) for every text that timed out, with the pieces that did arrive."""
+        if not self.pending:
+            return []
+        now = self.clock()
+        expired = [key for key, fragments in self.pending.items() if fragments.deadline < now]
+        return [(key, fragments.get_text(), fragments.message)
+                for key, fragments in ((key, self.pending.pop(key)) for key in expired)]
+
+
 class ChannelConnectionError(Exception):
     pass
 
@@ -30,110 +130,143 @@ class IncorrectMessageTypeError(Exception):
 class MessageFactory:
 
     def __init__(self):
-        pass
+        self.message_types = {message_type.prefix: message_type for message_type in
+                              (IconMessage, CharacterMessage, LOOCMessage, OOCMessage, MusicMessage, LocationMessage,
+                               RollMessage, ItemMessage, ClearMessage, ChoiceMessage, ChoiceReturnMessage)}
+
+    def build_message(self, message_type, *values, username="default", **fields):
+        """Builds an outgoing message, values and fields follow message_type.fields."""
+        return message_type(username, *values, **fields)
 
     def build_chat_message(self, **kwargs):
-        username = kwargs.get('username', None)
-        if username is not None:
-            result = ChatMessage(username, **kwargs)
-        else:
-            result = ChatMessage("default", **kwargs)
-        return result
+        return self.build_message(ChatMessage, **kwargs)
 
     def build_icon_message(self, **kwargs):
-        username = kwargs.get('username', None)
-        if username is not None:
-            result = IconMessage(username, **kwargs)
-        else:
-            result = IconMessage("default", **kwargs)
-        return result
+        return self.build_message(IconMessage, **kwargs)
 
     def build_character_message(self, character, link=None, version=None):
-        result = CharacterMessage("default", character, link, version)
-        return result
+        return self.build_message(CharacterMessage, character, link, version)
 
     def build_location_message(self, location):
-        result = LocationMessage("default", location)
-        return result
+        return self.build_message(LocationMessage, location)
 
     def build_ooc_message(self, content):
-        result = OOCMessage("default", content)
-        return result
+        return self.build_message(OOCMessage, content)
 
     def build_looc_message(self, location, content):
-        result = LOOCMessage("default", location, content)
-        return result
+        return self.build_message(LOOCMessage, location, content)
 
     def build_music_message(self, track_name, url):
-        result = MusicMessage("default", track_name, url)
-        return result
+        return self.build_message(MusicMessage, track_name, url)
 
     def build_roll_message(self, roll):
-        result = RollMessage("default", roll)
-        return result
+        return self.build_message(RollMessage, roll)
 
     def build_item_message(self, item):
-        result = ItemMessage("default", item)
-        return result
+        return self.build_message(ItemMessage, item)
 
     def build_clear_message(self, location):
-        result = ClearMessage("default", location)
-        return result
+        return self.build_message(ClearMessage, location)
 
     def build_choice_message(self, sender, text, options, list_of_users):
-        result = ChoiceMessage(sender, text, options, list_of_users)
-        return result
+        return self.build_message(ChoiceMessage, text, options, list_of_users, username=sender)
 
     def build_choice_return_message(self, sender, questioner, whisper, selected_option):
-        result = ChoiceReturnMessage(sender, questioner, whisper, selected_option)
-        return result
+        return self.build_message(ChoiceReturnMessage, questioner, whisper, selected_option, username=sender)
 
     def build_from_irc(self, irc_message, username):
-        if irc_message.count('#') >= 8:
-            result = ChatMessage(username)
-        elif irc_message.startswith("sc#"):
-            result = IconMessage(username)
-        elif irc_message.startswith('c#'):
-            result = CharacterMessage(username)
-        elif irc_message.startswith('LOOC#'):
-            result = LOOCMessage(username)
-        elif irc_message.startswith('OOC#'):
-            result = OOCMessage(username)
-        elif irc_message.startswith('m#'):
-            result = MusicMessage(username)
-        elif irc_message.startswith('l#'):
-            result = LocationMessage(username)
-        elif irc_message.startswith('r#'):
-            result = RollMessage(username)
-        elif irc_message.startswith('i#'):
-            result = ItemMessage(username)
-        elif irc_message.startswith('cl#'):
-            result = ClearMessage(username)
-        elif irc_message.startswith('ch#'):
-            result = ChoiceMessage(username)
-        elif irc_message.startswith('ch2#'):
-            result = ChoiceReturnMessage(username)
-        else:
-            result = OOCMessage(username)
-        result.from_irc(irc_message)
-        return result
+        prefix, separator, payload = irc_message.partition('#')
+        message_type = self.message_types.get(prefix)
+        if message_type is None:
+            if not separator:
+                # Plain text, most likely from a regular IRC client
+                return OOCMessage(username, irc_message)
+            # Chat messages have no prefix, they start with the location
+            message_type = ChatMessage
+            payload = irc_message
+        return message_type(username, *split_fields(message_type, payload))
+
+
+def split_fields(message_type, payload):
+    """Splits the payload of a message into the fields declared by its type."""
+    arguments = payload.split('#', len(message_type.fields) - 1)
+    if len(arguments) < message_type.required_fields:
+        raise IncorrectMessageTypeError("Malformed {} message".format(message_type.__name__))
+    return arguments
+
+
+class Message:
+    """Base of every message sent over the channel.
+
+    On the wire a message is its prefix followed by its fields, separated by '#'.
+    Only the last field may contain '#' itself. Constructors take the sender
+    followed by the fields in this order, and every subclass declares its fields
+    as __slots__ so messages don't carry an instance dict around.
+    """
 
+    __slots__ = ('sender',)
+    prefix = None
+    fields = ()
+    required_fields = 0
+    null_value = 'None'  # What a field set to None is sent as
+    fragmented = False  # Whether the last field may be split over several lines
 
-class ChatMessage:
+    @classmethod
+    def from_irc(cls, message, sender="default"):
+        if cls.prefix is not None:
+            message = message.partition('#')[2]
+        return cls(sender, *split_fields(cls, message))
 
-    def __init__(self, sender, **kwargs):
+    def to_irc(self):
+        values = [self.null_value if value is None else str(value) for value in self.get_field_values()]
+        if self.prefix is not None:
+            values.insert(0, self.prefix)
+        return '#'.join(values)
+
+    def to_irc_lines(self, limit):
+        """Returns the lines the message is sent as, none of them longer than limit bytes."""
+        line = self.to_irc()
+        if not self.fragmented or len(line.encode('utf-8')) <= limit:
+            return [line]
+        content = line.split('#', len(self.fields) - (self.prefix is None))[-1]
+        head = line[:len(line) - len(content)]
+        budget = limit - len(head.encode('utf-8'))
+        if budget <= FRAGMENT_HEADER_BYTES:
+            return [line]
+        return [head + fragment for fragment in frame(content, budget)]
+
+    def get_field_values(self):
+        return [getattr(self, name) for name in self.fields]
+
+    def merge(self, other):
+        """Takes over the fields of a newer message of the same type."""
+        for name in self.fields:
+            setattr(self, name, getattr(other, name))
+
+
+class ChatMessage(Message):
+    fields = ('location', 'sublocation', 'character', 'sprite', 'position', 'color_id', 'sprite_option',
+              'sfx_name', 'content')
+    __slots__ = fields
+    fragmented = True
+    required_fields = 9
+    null_value = '0'
+
+    def __init__(self, sender, location=None, sublocation=None, character=None, sprite=None, position=None,
+                 color_id=None, sprite_option=None, sfx_name=None, content=None):
         # TODO Try to reduce the number of arguments
-        self.components = kwargs
         self.sender = sender
-        self.content = kwargs.get('content')
-        self.location = kwargs.get('location')
-        self.sublocation = kwargs.get('sublocation')
-        self.character = kwargs.get('character')
-        self.sprite = kwargs.get('sprite')
-        self.position = kwargs.get('position')
-        self.color_id = kwargs.get('color_id')
-        self.sprite_option = kwargs.get('sprite_option')
-        self.sfx_name = kwargs.get('sfx_name')
+        self.content = content
+        self.location = location
+        self.sublocation = sublocation
+        self.character = character
+        self.sprite = sprite
+        self.position = position
+        self.color_id = color_id
+        self.sprite_option = sprite_option
+        if sfx_name == '0':
+            sfx_name = None
+        self.sfx_name = sfx_name
         self.remove_line_breaks()
 
     def remove_line_breaks(self):
@@ -143,20 +276,6 @@ class ChatMessage:
             self.content = self.content.replace('\n', ' ')
             self.content = self.content.replace('\r', ' ')
 
-    def to_irc(self):
-        if self.components['sfx_name'] is None:
-            self.components['sfx_name'] = '0'
-        msg = "{0[location]}#{0[sublocation]}#{0[character]}#{0[sprite]}#" \
-              "{0[position]}#{0[color_id]}#{0[sprite_option]}#{0[sfx_name]}#{0[content]}".format(self.components)
-        return msg
-
-    def from_irc(self, message):
-        arguments = tuple(message.split('#', 8))
-        self.location, self.sublocation, self.character, self.sprite, self.position, \
-            self.color_id, self.sprite_option, self.sfx_name, self.content = arguments
-        if self.sfx_name == '0':
-            self.sfx_name = None
-
     def execute(self, connection_manager, main_screen, user_handler):
         if main_screen.text_box.is_displaying_msg:
             connection_manager.irc_connection.put_back_msg(self)
@@ -206,36 +325,22 @@ class ChatMessage:
         mention: str = "@{0}".format(username)
         return msg == mention or mention+" " in msg
 
-class IconMessage:
+class IconMessage(Message):
+    prefix = 'sc'
+    fields = ('location', 'sublocation', 'character', 'sprite', 'position', 'sprite_option', 'dance')
+    __slots__ = fields
+    required_fields = 6
 
-    def __init__(self, sender, **kwargs):
-        self.components = kwargs
+    def __init__(self, sender, location=None, sublocation=None, character=None, sprite=None, position=None,
+                 sprite_option=None, dance=False):
         self.sender = sender
-        self.location = kwargs.get('location')
-        self.sublocation = kwargs.get('sublocation')
-        self.character = kwargs.get('character')
-        self.sprite = kwargs.get('sprite')
-        self.position = kwargs.get('position')
-        self.sprite_option = kwargs.get('sprite_option')
-        self.dance = kwargs.get('dance')
-
-    def to_irc(self):
-        msg = "sc#{0[location]}#{0[sublocation]}#{0[character]}#{0[sprite]}#" \
-              "{0[position]}#{0[sprite_option]}#{0[dance]}".format(self.components)
-        return msg
-
-    def from_irc(self, message):
-        try:
-            arguments = message.split('#', 7)
-            arguments.remove("sc")
-            self.location, self.sublocation, self.character, self.sprite, self.position, \
-            self.sprite_option, self.dance = arguments
-        except ValueError:
-            arguments = message.split('#', 6)
-            arguments.remove("sc")
-            self.location, self.sublocation, self.character, self.sprite, self.position, \
-            self.sprite_option = arguments
-            self.dance = False
+        self.location = location
+        self.sublocation = sublocation
+        self.character = character
+        self.sprite = sprite
+        self.position = position
+        self.sprite_option = sprite_option
+        self.dance = dance
 
     def execute(self, connection_manager, main_screen, user_handler):
         username = self.sender
@@ -269,7 +374,11 @@ class IconMessage:
         else:
             main_screen.ooc_window.update_subloc(user.username, self.sublocation)
 
-class ChoiceMessage:
+class ChoiceMessage(Message):
+    prefix = 'ch'
+    fields = ('text', 'options', 'list_of_users')
+    __slots__ = fields
+    required_fields = 3
 
     def __init__(self, sender, text=None, options=None, list_of_users=None):
         if text is None:
@@ -278,21 +387,11 @@ class ChoiceMessage:
             options = 'Options'
         if list_of_users is None:
             list_of_users = 'everyone'
-        self.components = {'text': text, 'options': options, 'list_of_users': list_of_users}
         self.sender = sender
         self.text = text
         self.options = options
         self.list_of_users = list_of_users
 
-    def to_irc(self):
-        msg = "ch#{0[text]}#{0[options]}#{0[list_of_users]}".format(self.components)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 3)
-        arguments.remove('ch')
-        self.text, self.options, self.list_of_users = arguments
-
     def execute(self, connection_manager, main_screen, user_handler):
         user = user_handler.get_user()
         username = user.username
@@ -300,8 +399,8 @@ class ChoiceMessage:
         options = re.split(r'(?<!\\);', self.options)
         try:
             user = main_screen.users[self.sender]
-            if user.get_loc() is not None:
-                if user.get_loc().name != user_handler.get_current_loc().name:
+            if presence.get_loc_name(user) is not None:
+                if not presence.in_same_location(user, user_handler.get_user()):
                     return
         except KeyError:
             pass
@@ -319,24 +418,18 @@ class ChoiceMessage:
         log.add_entry(self.sender+' gave '+self.list_of_users+' a choice.\n')
 
 
-class ChoiceReturnMessage:
+class ChoiceReturnMessage(Message):
+    prefix = 'ch2'
+    fields = ('questioner', 'whisper', 'selected_option')
+    __slots__ = fields
+    required_fields = 3
 
     def __init__(self, sender, questioner=None, whisper=False, selected_option=None):
-        self.components = {'questioner': questioner, 'whisper': whisper, 'selected_option': selected_option}
         self.questioner = questioner
         self.whisper = whisper
         self.selected_option = selected_option
         self.sender = sender
 
-    def to_irc(self):
-        msg = "ch2#{0[questioner]}#{0[whisper]}#{0[selected_option]}".format(self.components)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#')
-        arguments.remove('ch2')
-        self.questioner, self.whisper, self.selected_option = arguments
-
     def execute(self, connection_manager, main_screen, user_handler):
         log = main_screen.log_window
         username = user_handler.get_user().username
@@ -354,46 +447,32 @@ class ChoiceReturnMessage:
                 user_handler.send_message(self.selected_option)
 
 
-class CharacterMessage:
+class CharacterMessage(Message):
+    prefix = 'c'
+    fields = ('character', 'character_link', 'version')
+    __slots__ = fields
+    required_fields = 1
 
-    def __init__(self, sender, character=None, link=None, version=None):
+    def __init__(self, sender, character=None, character_link=None, version=''):
         self.sender = sender
         self.character = character
-        self.character_link = link
+        self.character_link = character_link
         self.version = version
 
-    def to_irc(self):
-        msg = "c#{0}#{1}#{2}".format(self.character, self.character_link, self.version)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 3)
-        self.character = arguments[1]
-        if len(arguments) > 2: #If it works...
-            self.character_link = arguments[2]
-        if len(arguments) > 3:
-            self.version = arguments[3]
-        else:
-            self.version = ''
-
     def execute(self, connection_manager, main_screen, user_handler):
         connection_manager.update_char(main_screen, self.character, self.sender, self.character_link, self.version)
 
 
-class LocationMessage:
+class LocationMessage(Message):
+    prefix = 'l'
+    fields = ('location',)
+    __slots__ = fields
+    required_fields = 1
 
     def __init__(self, sender, location=None):
         self.sender = sender
         self.location = location
 
-    def to_irc(self):
-        msg = "l#{0}".format(self.location)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 1)
-        self.location = arguments[1]
-
     def execute(self, connection_manager, main_screen, user_handler: CurrentUserHandler):
         username = self.sender
         loc = self.location
@@ -414,7 +493,12 @@ class LocationMessage:
         main_screen.ooc_window.update_loc(user.username, loc)
         main_screen.sprite_window.refresh_sub()
 
-class OOCMessage:
+class OOCMessage(Message):
+    prefix = 'OOC'
+    fields = ('content',)
+    __slots__ = fields
+    fragmented = True
+    required_fields = 1
 
     def __init__(self, sender, content=None):
         self.sender = sender
@@ -428,23 +512,15 @@ class OOCMessage:
             self.content = self.content.replace('\n', ' ')
             self.content = self.content.replace('\r', ' ')
 
-    def to_irc(self):
-        msg = "OOC#{0}".format(self.content)
-        return msg
-
-    def from_irc(self, message):
-        try:
-            arguments = message.split('#', 1)
-            self.content = arguments[1]
-        except IndexError:
-            self.content = message
-
-        self.remove_line_breaks()
-
     def execute(self, connection_manager, main_screen, user_handler):
         main_screen.ooc_window.update_ooc(self.content, self.sender)
 
-class LOOCMessage:
+class LOOCMessage(Message):
+    prefix = 'LOOC'
+    fields = ('location', 'content')
+    __slots__ = fields
+    fragmented = True
+    required_fields = 2
 
     def __init__(self, sender, location=None, content=None):
         self.sender = sender
@@ -459,20 +535,6 @@ class LOOCMessage:
             self.content = self.content.replace('\n', ' ')
             self.content = self.content.replace('\r', ' ')
 
-    def to_irc(self):
-        msg = "LOOC#{0}#{1}".format(self.location, self.content)
-        return msg
-
-    def from_irc(self, message):
-        try:
-            arguments = message.split('#', 2)
-            self.location = arguments[1]
-            self.content = arguments[2]
-        except IndexError:
-            self.content = message
-
-        self.remove_line_breaks()
-
     def execute(self, connection_manager, main_screen, user_handler: CurrentUserHandler):
         username = self.sender
         if username == "default":
@@ -487,40 +549,27 @@ class LOOCMessage:
             main_screen.ooc_window.update_ooc(self.content, self.sender, True)
 
 
-class MusicMessage:
+class MusicMessage(Message):
+    prefix = 'm'
+    fields = ('track_name', 'url')
+    __slots__ = fields
+    required_fields = 1
+    null_value = '0'
 
     def __init__(self, sender, track_name=None, url=None):
+        if track_name == "0":
+            track_name = None
+        if url == "0":
+            url = None
         self.sender = sender
         self.track_name = track_name
         self.url = url
 
-    def to_irc(self):
-        if self.track_name is None:
-            self.track_name = "0"
-        if self.url is None:
-            self.url = "0"
-        msg = "m#{0}#{1}".format(self.track_name, self.url)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 2)
-        self.track_name = arguments[1]
-        if self.track_name == "0":
-            self.track_name = None
-        try:
-            self.url = arguments[2]
-        except IndexError:
-            self.url = None
-        if self.url == "0":
-            self.url = None
 
     def execute(self, connection_manager, main_screen, user_handler):
         username = self.sender
         user = main_screen.users[username]
-        if user.get_loc() is not None:
-            if user.get_loc().name != user_handler.get_current_loc().name:
-                return
-        else:
+        if not presence.in_same_location(user, user_handler.get_user()):
             return
         if self.track_name == "stop":
             main_screen.log_window.add_entry("{} stopped the music.\n".format(username))
@@ -531,32 +580,32 @@ class MusicMessage:
                                                            self.track_name)
 
 
-class RollMessage:
+class RollMessage(Message):
+    prefix = 'r'
+    fields = ('roll',)
+    __slots__ = fields
+    required_fields = 1
 
     def __init__(self, sender, roll=None):
         self.sender = sender
         self.roll = roll
 
-    def to_irc(self):
-        msg = "r#{0}".format(self.roll)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 1)
-        self.roll = arguments[1]
-
     def execute(self, connection_manager, main_screen, user_handler):
         username = self.sender
         if username == "default":
             username = "You"
         else:
             sender = main_screen.users[username]
-            if sender.get_loc().name != user_handler.get_current_loc().name:
+            if not presence.in_same_location(sender, user_handler.get_user()):
                 return
         main_screen.log_window.add_entry("{} rolled {}.\n".format(username, self.roll))
 
 
-class ItemMessage:
+class ItemMessage(Message):
+    prefix = 'i'
+    fields = ('item',)
+    __slots__ = fields
+    required_fields = 1
 
     def __init__(self, sender, item=None):
         self.sender = sender
@@ -570,14 +619,6 @@ class ItemMessage:
             self.item = self.item.replace('\n', ' ')
             self.item = self.item.replace('\r', ' ')
 
-    def to_irc(self):
-        msg = "i#{0}".format(self.item)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 1)
-        self.item = arguments[1]
-
     def execute(self, connection_manager, main_screen, user_handler):
         item_string = self.item
         dcdi = item_string.split("#", 3)
@@ -586,7 +627,7 @@ class ItemMessage:
         entry_text = ''
         if username != 'default':
             sender = main_screen.users[username]
-            if sender.get_loc().name != user_handler.get_current_loc().name:
+            if not presence.in_same_location(sender, user_handler.get_user()):
                 return
             entry_text = ' and it was added to your inventory'
         if username == 'default':
@@ -595,20 +636,16 @@ class ItemMessage:
         main_screen.log_window.add_entry("{} presented {}{}.\n".format(username, dcdi[0], entry_text))
 
 
-class ClearMessage:
+class ClearMessage(Message):
+    prefix = 'cl'
+    fields = ('location',)
+    __slots__ = fields
+    required_fields = 1
 
     def __init__(self, sender, location=None):
         self.sender = sender
         self.location = location
 
-    def to_irc(self):
-        msg = "cl#{0}".format(self.location)
-        return msg
-
-    def from_irc(self, message):
-        arguments = message.split('#', 1)
-        self.location = arguments[1]
-
     def execute(self, connection_manager, main_screen, user_handler):
         # TODO Make it work only for the person who is currently speaking
         loc = self.location
@@ -621,26 +658,113 @@ class ClearMessage:
 
 
 class MessageQueue:
-    """Standard First-In-First-Out queue for irc messages.
+    """First-In-First-Out queue for irc messages.
+
+    Local echoes go through a separate priority lane that is always drained first.
+    Once the capacity is reached the oldest regular message is dropped.
     """
 
-    def __init__(self):
-        self.messages = []
+    def __init__(self, capacity=2000):
+        self.messages = deque()
+        self.priority_messages = deque()
+        self.capacity = capacity
+        self.dropped = 0
 
     def is_empty(self):
-        return self.messages == []
+        return not self.messages and not self.priority_messages
 
     def enqueue(self, msg):
-        self.messages.insert(0, msg)
+        return self.push_back(msg)
+
+    def enqueue_priority(self, msg):
+        self.priority_messages.append(msg)
+
+    def push_back(self, msg):
+        """Appends msg, returns the message dropped to make room for it if any."""
+        dropped_msg = None
+        if len(self.messages) >= self.capacity:
+            dropped_msg = self.messages.popleft()
+            self.dropped += 1
+        self.messages.append(msg)
+        return dropped_msg
+
+    def push_front(self, msg):
+        self.messages.appendleft(msg)
 
     def dequeue(self):
+        if self.priority_messages:
+            return self.priority_messages.popleft()
         try:
-            return self.messages.pop()
+            return self.messages.popleft()
         except IndexError:
             return None
 
     def size(self):
-        return len(self.messages)
+        return len(self.messages) + len(self.priority_messages)
+
+
+class MessageCoalescer:
+    """Collapses icon and location updates that a sender queued back to back.
+
+    Only the latest state survives, written into the queue slot of the first superseded
+    message. Any other message from the same sender ends the run, so the order relative
+    to that sender's chat lines is kept.
+    """
+
+    coalescable = (IconMessage, LocationMessage)
+
+    def __init__(self):
+        self.pending = {}
+        self.collapsed = 0
+
+    def offer(self, msg):
+        """Returns True if msg was merged into a message that is still queued."""
+        previous = self.pending.get(msg.sender)
+        if previous is not None and type(previous) is type(msg):
+            previous.merge(msg)
+            self.collapsed += 1
+            return True
+        if isinstance(msg, self.coalescable):
+            self.pending[msg.sender] = msg
+        else:
+            self.pending.pop(msg.sender, None)
+        return False
+
+    def release(self, msg):
+        """Called once msg left the queue, later updates can't be merged into it anymore."""
+        if msg is not None and self.pending.get(msg.sender) is msg:
+            del self.pending[msg.sender]
+
+
+class HeldMessages:
+    """Messages waiting for the textbox to finish the line it is displaying.
+
+    Chat lines wait in arrival order. Once a sender has a message waiting, their later
+    messages wait behind it too, so a move or character switch isn't undone when the
+    older line is finally shown. Messages from other senders keep flowing.
+    """
+
+    def __init__(self):
+        self.messages = deque()
+        self.senders = {}  # sender -> number of their messages waiting
+
+    def hold(self, msg, busy):
+        """Returns True if msg has to wait, it is then kept until next() hands it out."""
+        if not self.senders.get(msg.sender) and not (isinstance(msg, ChatMessage) and (busy or self.messages)):
+            return False
+        self.messages.append(msg)
+        self.senders[msg.sender] = self.senders.get(msg.sender, 0) + 1
+        return True
+
+    def next(self, busy):
+        """Returns the oldest waiting message if it can be executed now."""
+        if not self.messages or (busy and isinstance(self.messages[0], ChatMessage)):
+            return None
+        msg = self.messages.popleft()
+        self.senders[msg.sender] -= 1
+        if not self.senders[msg.sender]:
+            del self.senders[msg.sender]
+        return msg
 
 
 class PrivateMessage:
@@ -657,21 +781,176 @@ class PrivateConversation:
 
 
 class PrivateMessageQueue:
-    """Standard First-In-First-Out queue for irc messages.
+    """First-In-First-Out queue for private messages, bounded like MessageQueue.
     """
-    def __init__(self):
-        self.private_messages = []
+    def __init__(self, capacity=500):
+        self.private_messages = deque()
+        self.capacity = capacity
+        self.dropped = 0
 
     def enqueue(self, msg, sender):
         message = PrivateMessage(msg, sender, "no")
-        self.private_messages.insert(0, message)
+        self.push_back(message)
+
+    def push_back(self, message):
+        if len(self.private_messages) >= self.capacity:
+            self.private_messages.popleft()
+            self.dropped += 1
+        self.private_messages.append(message)
+
+    def push_front(self, message):
+        self.private_messages.appendleft(message)
 
     def dequeue(self):
         try:
-            return self.private_messages.pop()
+            return self.private_messages.popleft()
         except IndexError:
             return None
 
+    def size(self):
+        return len(self.private_messages)
+
+
+class OutboundQueue:
+    """Lines waiting to be sent, released at the pace of a token bucket.
+
+    Chat goes out first, then icons, then presence replies. Lines pushed with a key
+    replace a pending line with the same key, keeping its place in the queue.
+
+    Lines carrying our location, character or sprite never overtake each other, the
+    receivers would put us back where an older line says. Pushing one moves the older
+    ones still waiting in a lower lane in front of it.
+    """
+    CHAT = 0
+    ICON = 1
+    PRESENCE = 2
+
+    # RFC 1459 flood control: a burst of five lines, then one line every two seconds
+    def __init__(self, rate=0.5, burst=5, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.last_refill = clock()
+        self.lanes = (deque(), deque(), deque())
+        self.keyed = {}
+        self.pushed = 0
+        self.lock = threading.Lock()
+        self.merged = 0
+        self.throttled = 0.0
+        self.throttled_since = None
+
+    def push(self, target, msg, priority=CHAT, key=None, state=False):
+        with self.lock:
+            if key is not None and key in self.keyed:
+                self.keyed[key][1] = target, msg
+                self.merged += 1
+                return
+            self.pushed += 1
+            entry = [key, (target, msg), state, self.pushed]
+            if state:
+                self.promote_state(priority)
+            self.lanes[priority].append(entry)
+            if key is not None:
+                self.keyed[key] = entry
+
+    def promote_state(self, priority):
+        older = []
+        for lane in self.lanes[priority + 1:]:
+            older.extend(entry for entry in lane if entry[2])
+            if older:
+                kept = [entry for entry in lane if not entry[2]]
+                lane.clear()
+                lane.extend(kept)
+        for entry in sorted(older, key=lambda entry: entry[3]):
+            # Merging a newer line into it would send that line too early
+            if entry[0] is not None:
+                del self.keyed[entry[0]]
+                entry[0] = None
+            self.lanes[priority].append(entry)
+
+    def pop(self):
+        """Returns the next (target, msg) pair allowed out, or None."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            lane = next((lane for lane in self.lanes if lane), None)
+            if lane is None:
+                return None
+            if self.tokens < 1:
+                if self.throttled_since is None:
+                    self.throttled_since = now
+                return None
+            if self.throttled_since is not None:
+                self.throttled += now - self.throttled_since
+                self.throttled_since = None
+            self.tokens -= 1
+            key, line = lane.popleft()[:2]
+            if key is not None:
+                del self.keyed[key]
+            return line
+
+    def size(self):
+        return sum(len(lane) for lane in self.lanes)
+
+
+class Backoff:
+    """Jittered exponential delays between reconnection attempts."""
+
+    def __init__(self, base=2.0, cap=120.0):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * 2 ** self.attempts)
+        self.attempts += 1
+        # Keep at least half of the delay so clients dropped together don't all come back at once
+        return random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class PresenceDebouncer:
+    """Decides when joins are answered with our location, character and icon.
+
+    Joins within the window get a single answer. The answer is skipped when each of
+    those has already gone out to the channel since the latest join, for example
+    because we moved or changed sprite in the meantime.
+    """
+
+    state_types = (LocationMessage, CharacterMessage, IconMessage)
+
+    def __init__(self, window=2.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.pending = False
+        self.last_join = None
+        self.last_sent = {}  # message type -> when it last went out
+
+    def join(self):
+        """Returns in how many seconds to answer, or None if an answer is already scheduled."""
+        self.last_join = self.clock()
+        if self.pending:
+            return None
+        self.pending = True
+        # Spread the replies of everyone in the channel instead of answering in the same instant
+        return random.uniform(self.window, self.window * 1.5)
+
+    def sent(self, msg):
+        if isinstance(msg, self.state_types):
+            self.last_sent[type(msg)] = self.clock()
+
+    def is_due(self):
+        """Called when the answer's time comes, returns whether it still has to be sent."""
+        self.pending = False
+        if self.last_join is None:
+            return False
+        return not all(self.last_sent.get(state_type, self.last_join) > self.last_join
+                       for state_type in self.state_types)
+
 
 class IrcConnection:
 
@@ -683,11 +962,21 @@ class IrcConnection:
         self.channel = channel
         self._joined = False
         self.msg_q = MessageQueue()
+        self.coalescer = MessageCoalescer()
         self.p_msg_q = PrivateMessageQueue()
         self.on_join_handler = None
         self.on_users_handler = None
         self.on_disconnect_handler = None
         self.connection_manager = None
+        # Messages parsed and callbacks scheduled by the network thread, drained by process()
+        self.inbox = queue.Queue()
+        # Connection calls made on the main thread, performed by the network thread
+        self.outbox = queue.Queue()
+        self.message_factory = MessageFactory()
+        self.outbound = OutboundQueue()
+        self.assembler = FragmentAssembler()
+        self.network_thread = None
+        self.running = False
 
         if password is not None:
             if not password.strip():
@@ -701,50 +990,149 @@ class IrcConnection:
             Logger.warning('IRC: Could not connect to server')
             raise
 
-        events = ["welcome", "join", "quit", "pubmsg", "nicknameinuse", "namreply", "privnotice", "privmsg", "pong"]
+        events = ["welcome", "join", "quit", "pubmsg", "nicknameinuse", "namreply", "privnotice", "privmsg", "pong",
+                  "disconnect"]
         for e in events:
             self.connection.add_global_handler(e, getattr(self, "on_" + e))
 
+    def start(self):
+        """Starts the network thread, the handlers have to be set before."""
+        self.running = True
+        self.network_thread = threading.Thread(target=self.run, name="IRC", daemon=True)
+        self.network_thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        """Network thread, owns the reactor and performs every call on the connection."""
+        while self.running:
+            try:
+                self.reactor.process_once(timeout=0.02)
+            except Exception:
+                Logger.warning(traceback.format_exc())
+            self.flush_outbox()
+            self.flush_outbound()
+            self.expire_fragments()
+
+    def expire_fragments(self):
+        for (sender, prefix), text, message in self.assembler.expire():
+            if message is None:
+                self.call_on_main_thread(self.p_msg_q.enqueue, text, sender)
+            else:
+                message.content = text
+                self.inbox.put(message)
+
+    def flush_outbound(self):
+        while self.connection.is_connected():
+            line = self.outbound.pop()
+            if line is None:
+                return
+            try:
+                self.connection.privmsg(*line)
+            except irc.client.ServerNotConnectedError:
+                self.call_on_main_thread(self.connection_manager.get_disconnected)
+                return
+
+    def flush_outbox(self):
+        while True:
+            try:
+                command, args = self.outbox.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                command(*args)
+            except irc.client.ServerNotConnectedError:
+                self.call_on_main_thread(self.connection_manager.get_disconnected)
+            except irc.client.IRCError:
+                Logger.warning(traceback.format_exc())
+
+    def call_on_main_thread(self, callback, *args):
+        self.inbox.put(partial(callback, *args))
+
+    def call_on_network_thread(self, command, *args):
+        if not self.connection.is_connected():
+            raise irc.client.ServerNotConnectedError("Not connected.")
+        self.outbox.put((command, args))
+
+    def reconnect(self):
+        """Reopens the link with the arguments of the first connection.
+
+        is_connected() keeps reporting True during the outage, the connection manager tracks it instead.
+        """
+        self.outbox.put((self.reconnect_now, ()))
+
+    def reconnect_now(self):
+        try:
+            self.connection.reconnect()
+        except irc.client.ServerConnectionError:
+            Logger.warning('IRC: Could not reconnect to server')
+            self.call_on_main_thread(self.connection_manager.on_reconnect_failed)
+
+    @staticmethod
+    def get_text_limit(target):
+        """Bytes of text a line to target may carry once relayed by the server."""
+        return IRC_LINE_BYTES - SOURCE_RESERVE - len("PRIVMSG {} :\r\n".format(target).encode('utf-8'))
+
+    @staticmethod
+    def check_length(target, msg):
+        """Raises MessageTooLong right away, instead of later on the network thread."""
+        if len("PRIVMSG {} :{}\r\n".format(target, msg).encode('utf-8')) > 512:
+            raise irc.client.MessageTooLong("Messages limited to 512 bytes including CR/LF")
+
     def set_connection_manager(self, connection_manager):
         self.connection_manager = connection_manager
 
     def get_msg(self):
-        return self.msg_q.dequeue()
+        msg = self.msg_q.dequeue()
+        self.coalescer.release(msg)
+        return msg
 
     def put_back_msg(self, msg):
-        self.msg_q.messages.append(msg)
+        self.msg_q.push_front(msg)
 
     def get_pm(self):
         return self.p_msg_q.dequeue()
 
-    def send_msg(self, msg):
+    def send_msg(self, msg, priority=OutboundQueue.CHAT, key=None, state=False):
         if '\n' in msg:
-            messages = msg.splitlines()
-            new_msg = ""
-            for m in messages:
-                new_msg = new_msg + m
-            self.connection.privmsg(self.channel, new_msg)
-            return
-        self.connection.privmsg(self.channel, msg)
+            msg = ' '.join(msg.splitlines())
+        self.check_length(self.channel, msg)
+        if not self.connection.is_connected():
+            raise irc.client.ServerNotConnectedError("Not connected.")
+        self.outbound.push(self.channel, msg, priority, key, state)
 
     def send_private_msg(self, receiver, sender, msg):
         pm = PrivateMessage(msg, sender, receiver)
-        self.p_msg_q.private_messages.insert(0, pm)
-        if len(msg) > 480:  # controls the msg length so it doesn't crash
-            msg = (msg[:480] + '..')
-        self.connection.privmsg(receiver, msg)
+        self.p_msg_q.push_back(pm)
+        if not self.connection.is_connected():
+            raise irc.client.ServerNotConnectedError("Not connected.")
+        for line in frame(' '.join(msg.splitlines()), self.get_text_limit(receiver)):
+            self.outbound.push(receiver, line)
 
     def send_mode(self, username, msg):
-        self.connection.mode(username, msg)
+        self.call_on_network_thread(self.connection.mode, username, msg)
 
     def send_ping(self):
-        self.connection.ping(self.server)
+        self.call_on_network_thread(self.connection.ping, self.server)
 
     def is_connected(self):
         return self._joined
 
     def process(self):
-        self.reactor.process_once()
+        """Called on the main thread, takes over what the network thread produced since last frame."""
+        while True:
+            try:
+                item = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, Message):
+                if not self.coalescer.offer(item):
+                    self.coalescer.release(self.msg_q.enqueue(item))
+            else:
+                item()
+
+    # The handlers below run on the network thread
 
     def on_welcome(self, c, e):
         if irc.client.is_channel(self.channel):
@@ -756,31 +1144,41 @@ class IrcConnection:
         self._joined = True
         nick = e.source.nick
         if c.nickname != nick:
-            self.on_join_handler(nick)
+            self.call_on_main_thread(self.on_join_handler, nick)
+        else:
+            self.call_on_main_thread(self.connection_manager.on_channel_joined)
 
     def on_quit(self, c, e):
         nick = e.source.nick
-        self.on_disconnect_handler(nick)
+        self.call_on_main_thread(self.on_disconnect_handler, nick)
 
     def on_pubmsg(self, c, e):
         msg = e.arguments[0]
-        message_factory = App.get_running_app().get_message_factory()
         try:
-            message = message_factory.build_from_irc(msg, e.source.nick)
+            message = self.message_factory.build_from_irc(msg, e.source.nick)
         except IncorrectMessageTypeError:
             return
-        self.msg_q.enqueue(message)
+        if message.fragmented and message.content is not None:
+            whole = self.assembler.feed(get_fragment_key(message.sender, message), message.content, message)
+            if whole is None:
+                return
+            text, message = whole
+            message.content = text
+        self.inbox.put(message)
 
     def on_namreply(self, c, e):
-        self.on_users_handler(e.arguments[2])
+        self.call_on_main_thread(self.on_users_handler, e.arguments[2])
 
     def on_privnotice(self, c, e):
         server_response = e.arguments[0]
         Logger.info('IRC: {}'.format(server_response))
 
     def on_nicknameinuse(self, c, e):
+        self.call_on_main_thread(self.pick_another_nickname)
+
+    def pick_another_nickname(self):
         if len(App.get_running_app().get_user().username) < 16:
-            c.nick(App.get_running_app().get_user().username + '_')
+            self.outbox.put((self.connection.nick, (App.get_running_app().get_user().username + '_',)))
             App.get_running_app().get_user().username += '_'
             return
         temp_pop = MOPopup("Username in use", "Username in use, pick another one.", "OK")
@@ -788,17 +1186,21 @@ class IrcConnection:
         temp_pop.box_lay.add_widget(text_inp)
 
         def temp_handler(*args):
-            c.nick(text_inp.text)
+            self.outbox.put((self.connection.nick, (text_inp.text,)))
             App.get_running_app().get_user().username = text_inp.text
         temp_pop.bind(on_dismiss=temp_handler)
         temp_pop.open()
 
     def on_privmsg(self, c, e):
-        msg = e.arguments[0]
-        self.p_msg_q.enqueue(msg, e.source.nick)
+        whole = self.assembler.feed(get_fragment_key(e.source.nick), e.arguments[0])
+        if whole is not None:
+            self.call_on_main_thread(self.p_msg_q.enqueue, whole[0], e.source.nick)
 
     def on_pong(self, c, e):
-        self.connection_manager.receive_pong()
+        self.call_on_main_thread(self.connection_manager.receive_pong)
+
+    def on_disconnect(self, c, e):
+        self.call_on_main_thread(self.connection_manager.get_disconnected)
 
 
 class ConnectionManager:
@@ -809,8 +1211,22 @@ class ConnectionManager:
         self.not_again_flag = False
         self.ping_event = None
         self.disconnected_event = None
+        self.reconnecting = False
+        self.reconnect_event = None
+        self.reconnect_backoff = Backoff()
+        self.disconnected_popup = None
+        self.presence_debouncer = PresenceDebouncer()
+        self.held = HeldMessages()
+        config = App.get_running_app().config
+        # Time slice in seconds that update_chat may spend executing queued messages each frame
+        self.dispatch_budget = 0
+        self.set_dispatch_budget(config.getdefaultint('other', 'dispatch_budget', 4))
+        config.add_callback(lambda section, key, value: self.set_dispatch_budget(value), 'other', 'dispatch_budget')
         self.reschedule_ping()
 
+    def set_dispatch_budget(self, milliseconds):
+        self.dispatch_budget = int(milliseconds) / 1000.0
+
     def reschedule_ping(self):
         if self.ping_event is not None:
             self.ping_event.cancel()
@@ -824,15 +1240,54 @@ class ConnectionManager:
         self.disconnected_event = Clock.schedule_once(self.get_disconnected, 10)
 
     def get_disconnected(self, *args):
+        if self.reconnecting:
+            return
+        self.reconnecting = True
+        self.ping_event.cancel()
+        if self.disconnected_event is not None:
+            self.disconnected_event.cancel()
+        Logger.warning('IRC: Lost connection to the server')
         if self.not_again_flag is False:
-            self.ping_event.cancel()
-            popup = MOPopup("Disconnected", "Seems you might be disconnected from IRC :(", "Okay.")
-            popup.create_button("Don't show this again", False, btn_command=self.set_flag())
+            popup = MOPopup("Disconnected", "Seems you might be disconnected from IRC :(\nTrying to reconnect...",
+                            "Okay.")
+            popup.create_button("Don't show this again", False, btn_command=self.set_flag)
             popup.size = 800 / 2, 600 / 3
             popup.pos_hint = {'top': 1}
             popup.background_color = [0, 0, 0, 0]
             popup.open()
-            # TODO Implement reconnection strategy
+            self.disconnected_popup = popup
+        self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        delay = self.reconnect_backoff.next_delay()
+        Logger.info('IRC: Reconnecting in {:.1f} seconds'.format(delay))
+        self.reconnect_event = Clock.schedule_once(self.try_reconnect, delay)
+
+    def try_reconnect(self, dt):
+        self.irc_connection.reconnect()
+        # Give up on this attempt if the channel isn't joined in time
+        self.reconnect_event = Clock.schedule_once(self.on_reconnect_failed, 30)
+
+    def on_reconnect_failed(self, *args):
+        if not self.reconnecting:
+            return
+        self.reconnect_event.cancel()
+        self.schedule_reconnect()
+
+    def on_channel_joined(self):
+        if not self.reconnecting:
+            return
+        self.reconnecting = False
+        self.reconnect_event.cancel()
+        self.reconnect_backoff.reset()
+        Logger.info('IRC: Reconnected')
+        if self.disconnected_popup is not None:
+            self.disconnected_popup.dismiss()
+            self.disconnected_popup = None
+        main_scr = App.get_running_app().get_main_screen()
+        main_scr.log_window.add_entry("Reconnected.\n")
+        self.send_presence()
+        self.reschedule_ping()
 
     def set_flag(self):
         self.not_again_flag = not self.not_again_flag
@@ -844,23 +1299,49 @@ class ConnectionManager:
         if self.disconnected_event is not None:
             self.disconnected_event.cancel()
 
-    def send_msg(self, msg, *args):
+    def send_msg(self, msg, presence=False):
+        """Queues the message for the channel, presence replies to joiners are merged per message type."""
+        if presence:
+            priority, key = OutboundQueue.PRESENCE, msg.prefix
+        elif isinstance(msg, IconMessage):
+            priority, key = OutboundQueue.ICON, None
+        else:
+            priority, key = OutboundQueue.CHAT, None
+        state = isinstance(msg, (ChatMessage, IconMessage, LocationMessage, CharacterMessage))
+        self.presence_debouncer.sent(msg)
         try:
-            irc_message = msg.to_irc()
-            self.irc_connection.send_msg(irc_message, *args)
+            for irc_message in msg.to_irc_lines(self.irc_connection.get_text_limit(self.irc_connection.channel)):
+                self.irc_connection.send_msg(irc_message, priority, key, state)
         except irc.client.ServerNotConnectedError:
             self.get_disconnected()
-        self.reschedule_ping()
+        if not self.reconnecting:
+            self.reschedule_ping()
 
     def send_local(self, msg):
-        self.irc_connection.msg_q.enqueue(msg)
+        self.irc_connection.msg_q.enqueue_priority(msg)
 
     def update_chat(self, dt):
-        msg = self.irc_connection.get_msg()
-        if msg is not None:
-            main_scr = App.get_running_app().get_main_screen()
-            user_handler = App.get_running_app().get_user_handler()
+        """Executes as many queued messages as fit in the dispatch budget.
+
+        At least one message is executed each frame, however small the budget.
+        Chat messages are held back while the textbox is still displaying a line,
+        along with anything their senders queued after them. Messages from other
+        senders are allowed to flow past.
+        """
+        main_scr = App.get_running_app().get_main_screen()
+        user_handler = App.get_running_app().get_user_handler()
+        deadline = time.perf_counter() + self.dispatch_budget
+        executed = False
+        while not executed or time.perf_counter() < deadline:
+            msg = self.held.next(main_scr.text_box.is_displaying_msg)
+            if msg is None:
+                msg = self.irc_connection.get_msg()
+                if msg is None:
+                    break
+                if self.held.hold(msg, main_scr.text_box.is_displaying_msg):
+                    continue
             msg.execute(self, main_scr, user_handler)
+            executed = True
 
     def update_music(self, track_name, url=None):
         message_factory = App.get_running_app().get_message_factory()
@@ -891,16 +1372,31 @@ class ConnectionManager:
             main_scr.users[username] = User(username)
             main_scr.ooc_window.add_user(main_scr.users[username])
         main_scr.log_window.add_entry("{} has joined.\n".format(username))
+        self.schedule_presence()
+
+    def schedule_presence(self):
+        delay = self.presence_debouncer.join()
+        if delay is not None:
+            Clock.schedule_once(self.announce_presence, delay)
+
+    def announce_presence(self, dt):
+        if self.presence_debouncer.is_due():
+            self.send_presence()
+
+    def send_presence(self):
+        """Tells the channel where the local user is and what they look like."""
+        user_handler = App.get_running_app().get_user_handler()
+        user = user_handler.get_user()
         loc = user_handler.get_current_loc().name
         message_factory = App.get_running_app().get_message_factory()
         loc_message = message_factory.build_location_message(loc)
-        self.send_msg(loc_message)
+        self.send_msg(loc_message, presence=True)
         char = user.get_char()
         if char is not None:
             message_factory = App.get_running_app().get_message_factory()
             char_msg = message_factory.build_character_message(char.name, char.link, char.version)
-            self.send_msg(char_msg)
-            App.get_running_app().send_current_nullpost()
+            self.send_msg(char_msg, presence=True)
+            App.get_running_app().send_current_nullpost(presence=True)
 
     def on_disconnect(self, username):
         main_scr = App.get_running_app().get_main_screen()
@@ -908,7 +1404,7 @@ class ConnectionManager:
         main_scr.ooc_window.delete_user(username)
         try:
             main_scr.users[username].remove()
-            del main_scr.users[username]
+            presence.remove(main_scr.users.pop(username))
         except KeyError:
             pass
 
@@ -919,6 +1415,7 @@ class ConnectionManager:
         for u in users:
             if u == "@" + user.username:
                 continue
-            if u != user.username:
+            # Users already known are kept as they are when the names get replayed after a reconnect
+            if u != user.username and u not in main_scr.users:
                 main_scr.users[u] = User(u)
                 main_scr.ooc_window.add_user(main_scr.users[u])
@@ -2,9 +2,8 @@ from kivy.core.window import Window
 from kivy.uix.widget import Widget
 from kivy.app import App
 from MysteryOnline.character_select import CharacterSelect
-from MysteryOnline.character import Character, characters
+from MysteryOnline.character import characters
 from MysteryOnline.location import location_manager
-import os
 
 
 class KeyboardListener(Widget):
@@ -60,33 +59,28 @@ class KeyboardListener(Widget):
         toolbar.text_item_btn.text = "no item"
 
     def refresh(self):
+        # Only what changed on disk is rebuilt, everything else keeps its objects and loaded sprites
         from MysteryOnline.mainscreen import RightClickMenu
         user = App.get_running_app().get_user()
-        location_manager.is_loaded = False
-        location_manager.get_locations()
-        RightClickMenu.on_loc_select(None, None, user.location.name)
-        self.refresh_characters()
+        changed_locations = location_manager.refresh()
+        if user.location.name in changed_locations and location_manager.has_location(user.location.name):
+            RightClickMenu.on_loc_select(None, None, user.location.name)
+        changed_characters = self.refresh_characters()
         main_scr = App.get_running_app().get_main_screen()
+        if changed_characters:
+            characters.rebind(main_scr.users.values(), changed_characters)
+            main_scr.sprite_window.refresh_sub()
         toolbar = main_scr.get_toolbar()
-        toolbar.sfx_dropdown.clear_widgets()
-        toolbar.sfx_list = []
-        toolbar.load_sfx()
-        toolbar.create_sfx_dropdown()
-        main_scr.left_tab.music_list.music_list_view.music_box_layout.clear_widgets()
-        main_scr.left_tab.music_list.ready()
-        user.get_char().nsfw_sprites = {}
-        user.get_char().spoiler_sprites = {}
-        user.get_char().cg_sprites = {}
-        try:
-            user.get_char().read_config()
-        except AttributeError:
-            pass
-        user.set_char(user.get_char())
-        user.get_char().load()
-        main_scr.on_new_char(user.get_char())
+        toolbar.refresh_sfx()
+        main_scr.left_tab.music_list.load_tracks()
+        char = user.get_char()
+        if char is None or char.name not in changed_characters:
+            return
+        char = characters.get(char.name, characters['RedHerring'])
+        user.set_char(char)
+        char.load()
+        main_scr.on_new_char(char)
 
     @staticmethod
     def refresh_characters():
-        characters.clear()
-        char = {name: Character(name) for name in os.listdir("characters") if os.path.isdir("characters/" + name)}
-        characters.update(char)
+        return characters.refresh()
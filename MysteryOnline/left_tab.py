@@ -175,6 +175,17 @@ class Track:
         main_scr.ooc_window.music_tab.on_music_play(url=self.url, track_name=self.name)
 
 
+class MusicBlock:
+    """The lines of one section of musiclist.txt and what was built from them."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.element = None
+        self.sections = {}
+        self.subsections = {}
+        self.tracks = {}
+
+
 class MusicListLabel(BoxLayout):
 
     def __init__(self, display, **kwargs):
@@ -226,6 +237,7 @@ class MusicList(TabbedPanelItem):
         self.subsection_search_space = []
         self.sections = {}
         self.subsections = {}
+        self.blocks = []
         self.search_results = SearchResults()
         self.search_done = False
         self.current_section = None
@@ -235,14 +247,37 @@ class MusicList(TabbedPanelItem):
         self.load_tracks()
 
     def load_tracks(self):
+        """Reads musiclist.txt, only the sections whose lines changed since the last read are built again."""
         try:
             with open('musiclist.txt', mode='r', encoding='utf-16') as f:
-                for line in f:
-                    if len(line) > 2:
-                        self.build_from_line(line)
+                lines = [line for line in f if len(line) > 2]
         except FileNotFoundError:
             Logger.warning('Music: musiclist.txt not found')
             return
+        old_blocks = {block.lines: block for block in self.blocks}
+        blocks = []
+        for block_lines in self.split_blocks(lines):
+            block = old_blocks.pop(block_lines, None)
+            if block is None:
+                block = MusicBlock(block_lines)
+                self.current_section = None
+                self.current_subsection = None
+                for line in block_lines:
+                    self.build_from_line(line, block)
+            blocks.append(block)
+        if [block.lines for block in blocks] == [block.lines for block in self.blocks]:
+            return
+        self.blocks = blocks
+        self.tracks = {}
+        self.sections = {}
+        self.subsections = {}
+        self.music_list_view.music_box_layout.clear_widgets()
+        for block in blocks:
+            self.tracks.update(block.tracks)
+            self.sections.update(block.sections)
+            self.subsections.update(block.subsections)
+            if block.element is not None:
+                self.music_list_view.add_element(block.element)
         self.track_search_space = list(self.tracks.keys())
         self.section_search_space = list(self.sections.keys())
         self.subsection_search_space = list(self.subsections.keys())
@@ -250,19 +285,32 @@ class MusicList(TabbedPanelItem):
         self.section_search_space.sort(key=str.lower)
         self.subsection_search_space.sort(key=str.lower)
 
-    def build_from_line(self, line):
-        music_list_element = None
+    @staticmethod
+    def split_blocks(lines):
+        """Groups the lines of musiclist.txt by section, as tuples starting at each [section] line."""
+        blocks = []
+        block = []
+        for line in lines:
+            if line.startswith('[') and block:
+                blocks.append(tuple(block))
+                block = []
+            block.append(line)
+        if block:
+            blocks.append(tuple(block))
+        return blocks
+
+    def build_from_line(self, line, block):
         if line.startswith('['):
             section = line[1:-2]
             track_section = TrackSection(section)
-            self.sections[section.lower()] = track_section
+            block.sections[section.lower()] = track_section
             self.current_section = track_section
             self.current_subsection = None
-            music_list_element = MusicListLabel(SectionLabel(track_section, text=section))
+            block.element = MusicListLabel(SectionLabel(track_section, text=section))
         elif line.startswith('<'):
             subsection = line[1:-2]
             track_subsection = TrackSubSection(subsection)
-            self.subsections[subsection.lower()] = track_subsection
+            block.subsections[subsection.lower()] = track_subsection
             self.current_subsection = track_subsection
             self.current_section.add_subsection(track_subsection)
         elif line.startswith('\\'):
@@ -272,13 +320,11 @@ class MusicList(TabbedPanelItem):
             track_name, track_url = line.split(':', 1)
             track_url = track_url.strip()
             track = Track(track_name, track_url, self.current_section, self.current_subsection)
-            self.tracks[track_name.lower()] = track
+            block.tracks[track_name.lower()] = track
             if self.current_subsection is None:
                 self.current_section.add_track(track)
             else:
                 self.current_subsection.add_track(track)
-        if music_list_element is not None:
-            self.music_list_view.add_element(music_list_element)
 
     def search(self, target):
         if target == "":
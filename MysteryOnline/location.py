@@ -1,33 +1,117 @@
 import os
+from collections import OrderedDict
+from functools import partial
 
+from kivy.clock import mainthread
+from kivy.core.image import Image as CoreImage, ImageLoader
 from kivy.graphics.texture import Texture
-from kivy.uix.image import Image
 from kivy.config import ConfigParser
+from kivy.logger import Logger
+
+from MysteryOnline import metadata_index
+
+
+class TextureCache:
+    """Background and foreground textures of the sublocations by path, least recently used first."""
+
+    def __init__(self, capacity=24):
+        self.capacity = capacity
+        self.textures = OrderedDict()
+        self.warming = set()
+
+    def get(self, path):
+        texture = self.textures.get(path)
+        if texture is not None:
+            self.textures.move_to_end(path)
+            return texture
+        try:
+            texture = CoreImage(path).texture
+        except Exception:
+            Logger.warning('Location: Could not load ' + path)
+            return None
+        self.put(path, texture)
+        return texture
+
+    def put(self, path, texture):
+        self.textures[path] = texture
+        self.textures.move_to_end(path)
+        while len(self.textures) > self.capacity:
+            self.textures.popitem(last=False)
+
+    def warm(self, paths):
+        """Decodes the images that aren't cached yet on a worker thread, the textures are made on the main thread."""
+        from MysteryOnline.icarus import get_decoder
+        for path in paths[:self.capacity]:
+            if path in self.textures or path in self.warming:
+                continue
+            self.warming.add(path)
+            future = get_decoder().submit(ImageLoader.load, path, nocache=True)
+            future.add_done_callback(partial(self.on_decoded, path))
+
+    @mainthread
+    def on_decoded(self, path, future):
+        self.warming.discard(path)
+        try:
+            image = future.result()
+        except Exception:
+            Logger.warning('Location: Could not load ' + path)
+            return
+        if path not in self.textures:
+            self.put(path, CoreImage(image).texture)
+
+
+location_textures = TextureCache()
+
+
+# Positions a user can take in a sublocation, the overlay is where the narrator goes
+OVERLAY = 'overlay'
+LEFT = 'left'
+CENTER = 'center'
+RIGHT = 'right'
+SLOTS = (OVERLAY, LEFT, CENTER, RIGHT)
+
+
+def get_pos_slot(pos):
+    if pos == 'right':
+        return RIGHT
+    elif pos == 'left':
+        return LEFT
+    return CENTER
 
 
 class SubLocation:
 
-    def __init__(self, name, img_path):
+    def __init__(self, name, img_path, foreground_path=None):
         self.name = name
         self.img_path = img_path
-        self.foreground_path: str = None
+        self.foreground_path: str = foreground_path
 
-        dir_path: str = os.path.dirname(img_path)
-        foreground_png: str = os.path.join(dir_path, name+"_foreground.png")  # We only support png
+        # Slot -> users in it, the last one is shown on top
+        self.slots = {slot: OrderedDict() for slot in SLOTS}
+        # User -> the slot they're in
+        self.user_slots = {}
 
-        if os.path.exists(foreground_png):
-            self.foreground_path = foreground_png
+    @property
+    def o_users(self):
+        return list(self.slots[OVERLAY])
 
-        self.c_users = []
-        self.l_users = []
-        self.r_users = []
-        self.o_users = []
+    @property
+    def c_users(self):
+        return list(self.slots[CENTER])
 
-    def get_img(self):
-        return Image(source=self.img_path)
+    @property
+    def l_users(self):
+        return list(self.slots[LEFT])
 
-    def get_foreground_img(self):
-        return Image(source=self.foreground_path)
+    @property
+    def r_users(self):
+        return list(self.slots[RIGHT])
+
+    def get_texture(self):
+        return location_textures.get(self.img_path)
+
+    def get_foreground_texture(self):
+        return location_textures.get(self.foreground_path)
 
     def has_foreground(self) -> bool:
         return self.foreground_path is not None
@@ -35,64 +119,129 @@ class SubLocation:
     def get_name(self):
         return self.name
 
+    def add_user(self, slot, user):
+        """Puts the user on top of a slot, taking them out of the one they were in."""
+        self.remove_user(user)
+        self.slots[slot][user] = None
+        self.user_slots[user] = slot
+
+    def remove_user(self, user, slot=None):
+        """Takes the user out of the sublocation, or only out of the given slot."""
+        current = self.user_slots.get(user)
+        if current is None or slot is not None and slot != current:
+            return
+        del self.slots[current][user]
+        del self.user_slots[user]
+
+    def get_top_user(self, slot):
+        users = self.slots[slot]
+        if not users:
+            return None
+        return next(reversed(users))
+
+    def get_slot(self, user):
+        return self.user_slots.get(user)
+
     def add_o_user(self, user):
-        self.o_users.append(user)
+        self.add_user(OVERLAY, user)
 
     def add_c_user(self, user):
-        self.c_users.append(user)
+        self.add_user(CENTER, user)
 
     def add_l_user(self, user):
-        self.l_users.append(user)
+        self.add_user(LEFT, user)
 
     def add_r_user(self, user):
-        self.r_users.append(user)
+        self.add_user(RIGHT, user)
 
     def get_c_user(self):
-        return self.c_users[-1]
+        return self.get_top_user(CENTER)
 
     def get_l_user(self):
-        return self.l_users[-1]
+        return self.get_top_user(LEFT)
 
     def get_r_user(self):
-        return self.r_users[-1]
+        return self.get_top_user(RIGHT)
 
     def get_o_user(self):
-        return self.o_users[-1]
+        return self.get_top_user(OVERLAY)
 
     def get_users(self) -> []:
-        return self.o_users + self.l_users + self.c_users + self.r_users
+        return list(self.user_slots)
 
     def remove_o_user(self, user):
-        if user in self.o_users:
-            self.o_users.remove(user)
+        self.remove_user(user, OVERLAY)
 
     def remove_c_user(self, user):
-        if user in self.c_users:
-            self.c_users.remove(user)
+        self.remove_user(user, CENTER)
 
     def remove_l_user(self, user):
-        if user in self.l_users:
-            self.l_users.remove(user)
+        self.remove_user(user, LEFT)
 
     def remove_r_user(self, user):
-        if user in self.r_users:
-            self.r_users.remove(user)
+        self.remove_user(user, RIGHT)
+
+    def is_consistent(self) -> bool:
+        """Whether the slots and the user -> slot map agree, for tests."""
+        count = 0
+        for slot, users in self.slots.items():
+            count += len(users)
+            if any(self.user_slots.get(user) != slot for user in users):
+                return False
+        return count == len(self.user_slots)
 
 
 class LocationManager:
+    """Keeps the sublocations of every location in the metadata index,
+    a location folder is listed again only when its modification time changed."""
 
-    def __init__(self):
+    def __init__(self, directory="locations", index_file=metadata_index.INDEX_FILE):
+        self.directory = directory
+        self.index_file = index_file
         self.locations = {}
         self.is_loaded = False
 
     def load_locations(self):
         if self.is_loaded:
             return
-        self.locations = {name: Location(name)
-                          for name in os.listdir("locations") if os.path.isdir("locations/" + name)}
-        for location_name in self.locations:
-            self.locations[location_name].load()
+        self.refresh()
+
+    def refresh(self):
+        """Lists the location folders again, keeping the Location and SubLocation objects that didn't change.
+
+        Returns the names of the locations that were added, removed or changed.
+        """
+        index = metadata_index.load_index(self.index_file)
+        indexed = index.setdefault('locations', {})
+        locations = {}
+        changed = set()
+        dirty = False
+        for name in os.listdir(self.directory):
+            location = self.locations.get(name)
+            if location is None:
+                location = Location(name, self.directory)
+            if not os.path.isdir(location.path):
+                continue
+            mtime = os.stat(location.path).st_mtime_ns
+            metadata = indexed.get(name)
+            if metadata is None or metadata['mtime'] != mtime:
+                location.load()
+                indexed[name] = {'mtime': mtime, 'sublocations': location.get_metadata()}
+                changed.add(name)
+                dirty = True
+            elif name not in self.locations:
+                location.load_metadata(metadata['sublocations'])
+                changed.add(name)
+            locations[name] = location
+        changed.update(name for name in self.locations if name not in locations)
+        for name in [name for name in indexed if name not in locations]:
+            del indexed[name]
+            dirty = True
+        if dirty:
+            metadata_index.save_index(index, self.index_file)
+        self.locations = locations
         self.is_loaded = True
+        return changed
 
     def get_locations(self):
         self.ensure_loaded()
@@ -116,11 +265,40 @@ class Location:
         self.placeholder_subloc = SubLocation('Missingno',  "misc_img/Missingno.jpg")
 
     def load(self):
-        for file in os.listdir(self.path):
+        files = os.listdir(self.path)
+        sublocations = {}
+        for file in files:
             strip: str = self.strip_ext(file)
             if strip.endswith("_foreground"):
                 continue
-            self.sublocations[strip] = SubLocation(strip, self.path+file)
+            foreground_png = strip + "_foreground.png"  # We only support png
+            foreground_path = self.path + foreground_png if foreground_png in files else None
+            sublocations[strip] = SubLocation(strip, self.path+file, foreground_path)
+        self.set_sublocations(sublocations)
+
+    def load_metadata(self, metadata):
+        self.set_sublocations({name: SubLocation(name, img_path, foreground_path)
+                               for name, (img_path, foreground_path) in metadata.items()})
+
+    def set_sublocations(self, sublocations):
+        # Sublocations whose files didn't change are kept, along with the users standing in them
+        for name, sub in sublocations.items():
+            old = self.sublocations.get(name)
+            if old is not None and (old.img_path, old.foreground_path) == (sub.img_path, sub.foreground_path):
+                sublocations[name] = old
+        self.sublocations = sublocations
+
+    def get_texture_paths(self):
+        paths = []
+        for name in self.list_sub():
+            sub = self.sublocations[name]
+            paths.append(sub.img_path)
+            if sub.has_foreground():
+                paths.append(sub.foreground_path)
+        return paths
+
+    def get_metadata(self):
+        return {name: [sub.img_path, sub.foreground_path] for name, sub in self.sublocations.items()}
 
     @staticmethod
     def strip_ext(name: str) -> str:
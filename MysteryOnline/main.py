@@ -53,6 +53,10 @@ import MysteryOnline.settings_types
 from MysteryOnline.mopopup import MOPopup
 from MysteryOnline.mopopup import MOPopupYN
 from MysteryOnline.location import location_manager
+from MysteryOnline.icarus import page_cache
+from MysteryOnline import sprite_cache
+from MysteryOnline.character import characters, on_sprite_config_change
+from MysteryOnline.prefetcher import SpritePrefetcher
 from os import listdir
 
 from MysteryOnline.commands import command_processor
@@ -76,11 +80,13 @@ class MainScreenManager(ScreenManager):
     def __init__(self, **kwargs):
         super(MainScreenManager, self).__init__(**kwargs)
         self.popup_ = MOPopup("Connection", "Connecting to IRC", "K", False)
+        self.prefetcher = SpritePrefetcher()
 
     def on_irc_connection(self, *args):
         """Called when the IRC connection is created"""
 
         self.set_handlers()
+        self.irc_connection.start()
         self.main_screen.user = App.get_running_app().get_user()
         Clock.schedule_interval(self.process_irc, 1.0 / 60.0)
         self.popup_.open()
@@ -105,6 +111,7 @@ class MainScreenManager(ScreenManager):
         self.main_screen.on_ready()
         connection_manager = App.get_running_app().get_user_handler().get_connection_manager()
         Clock.schedule_interval(connection_manager.update_chat, 1.0 / 60.0)
+        Clock.schedule_interval(self.prefetcher.prefetch, 0.25)
 
     def unset_the_r_flag(self):
         """Fixes being unable to receive private messages from other users"""
@@ -137,6 +144,16 @@ class MysteryOnlineApp(App):
         msm = MainScreenManager()
         self.keyboard_listener = KeyboardListener()
         location_manager.load_locations()
+        # The series lists are filled in while the characters are indexed
+        characters.ensure_scanned()
+        page_cache.set_budget(self.config.getdefaultint('other', 'texture_budget', 512))
+        self.config.add_callback(lambda section, key, value: page_cache.set_budget(value), 'other', 'texture_budget')
+        sprite_cache.set_budget(self.config.getdefaultint('other', 'sprite_cache_budget', 1024))
+        self.config.add_callback(lambda section, key, value: sprite_cache.set_budget(value),
+                                 'other', 'sprite_cache_budget')
+        sprite_cache.prune()
+        for key in ('nsfw_mode', 'spoiler_mode', 'whitelisted_series'):
+            self.config.add_callback(on_sprite_config_change, 'other', key)
         return msm
 
     def build_config(self, config):
@@ -169,7 +186,10 @@ class MysteryOnlineApp(App):
             'fav_characters': [],
             'fav_sfx': [],
             'fav_subloc': [],
-            'suppress_rainbow': 0
+            'suppress_rainbow': 0,
+            'dispatch_budget': 4,
+            'texture_budget': 512,
+            'sprite_cache_budget': 1024
         })
         config.setdefaults('command-shortcuts', {
             '>': "/color green '>"
@@ -347,14 +367,14 @@ class MysteryOnlineApp(App):
                 return
             ToastNotifier().show_toast(title, content, duration=10, icon_path=icon)
 
-    def send_current_nullpost(self):
+    def send_current_nullpost(self, presence=False):
         """Sends your current parameters as a nullpost. Useful for sending your parameters to new users."""
         np_message = self.message_factory \
             .build_icon_message(location=self.user.get_loc().name, sublocation=self.user_handler.get_current_subloc_name(),
                                 character=self.user.get_char().name, sprite=self.user.get_current_sprite().name,
                                 position=self.user.get_pos(), sprite_option=self.user_handler.get_current_sprite_option(),
                                 dance=self.user.get_dance())
-        self.user_handler.get_connection_manager().send_msg(np_message)
+        self.user_handler.get_connection_manager().send_msg(np_message, presence)
 
     @staticmethod
     def exponential_volume(volume):
@@ -0,0 +1,29 @@
+"""Metadata of the installed characters and locations, kept on disk so startup and refresh don't read every file."""
+import json
+import os
+
+from kivy.logger import Logger
+
+INDEX_FILE = "metadata_index.json"
+VERSION = 2
+
+
+def load_index(filename=INDEX_FILE):
+    try:
+        with open(filename, 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {'version': VERSION}
+    if not isinstance(index, dict) or index.get('version') != VERSION:
+        return {'version': VERSION}
+    return index
+
+
+def save_index(index, filename=INDEX_FILE):
+    temp_filename = filename + ".tmp"
+    try:
+        with open(temp_filename, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_filename, filename)
+    except OSError:
+        Logger.warning('MetadataIndex: Could not write ' + filename)
@@ -0,0 +1,43 @@
+from kivy.app import App
+
+from MysteryOnline.user import presence
+
+
+class SpritePrefetcher:
+    """Decodes the atlas pages of the users around us while nothing else is going on.
+
+    By the time one of them talks, their sprite only has to be bound.
+    """
+
+    def __init__(self, pages_per_tick=1):
+        self.pages_per_tick = pages_per_tick
+
+    @staticmethod
+    def get_wanted_sprites(users, location):
+        """Returns (character, sprite name) pairs for the users in location, current sprites first."""
+        present = [user for user in users if user.get_loc() is location and user.get_char() is not None]
+        wanted = [(user.get_char(), user.current_sprite) for user in present]
+        for user in present:
+            wanted.extend((user.get_char(), name) for name in user.recent_sprites)
+        return wanted
+
+    def is_idle(self, main_scr):
+        irc_connection = main_scr.manager.irc_connection
+        return not main_scr.text_box.is_displaying_msg and irc_connection.msg_q.is_empty()
+
+    def prefetch(self, dt):
+        main_scr = App.get_running_app().get_main_screen()
+        if main_scr is None or not self.is_idle(main_scr):
+            return
+        user = App.get_running_app().get_user()
+        location = user.get_loc()
+        if location is None:
+            return
+        users = [other for other in presence.get_location_users(location.name) if other is not user]
+        started = 0
+        for char, sprite_name in self.get_wanted_sprites(users, location):
+            char.load_without_icons()
+            if char.sprites.prefetch(sprite_name):
+                started += 1
+                if started >= self.pages_per_tick:
+                    return
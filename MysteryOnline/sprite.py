@@ -8,22 +8,39 @@ from kivy.uix.button import Button
 from kivy.uix.dropdown import DropDown
 from kivy.config import ConfigParser
 
-from MysteryOnline.location import SubLocation
+from MysteryOnline.location import SubLocation, OVERLAY, LEFT, CENTER, RIGHT
 from MysteryOnline.sprite_organizer import SpriteOrganizer
-import copy
+
+# Display classes, they decide whether a sprite is shown as is, hidden or drawn as a CG
+NSFW = 'nsfw'
+SPOILER = 'spoiler'
+CG = 'cg'
 
 
 class NullSprite:
 
     def __init__(self, name):
         self.name = name
+        self.display_class = None
+
+    def set_display_class(self, display_class):
+        pass
+
+    def set_nsfw(self):
+        pass
 
     def unset_nsfw(self):
         pass
 
+    def set_spoiler(self):
+        pass
+
     def unset_spoiler(self):
         pass
 
+    def set_cg(self):
+        pass
+
     def is_cg(self):
         return False
 
@@ -36,13 +53,13 @@ class NullSprite:
     def get_name(self):
         return self.name
 
-    def get_texture(self):
-        texture = self.return_spoiler_texture()
+    def get_texture(self, flipped=False):
+        texture = self.return_spoiler_texture(flipped)
         return texture
 
-    def return_spoiler_texture(self):
+    def return_spoiler_texture(self, flipped=False):
         spoiler_sprite = self.load_dummy_character_sprite('4')
-        return spoiler_sprite.get_texture()
+        return spoiler_sprite.get_texture(flipped)
 
     def load_dummy_character_sprite(self, sprite_name):
         from MysteryOnline.character import characters
@@ -56,25 +73,46 @@ class Sprite:
     def __init__(self, name, texture):
         self.name = name
         self.texture = texture
-        self.nsfw = False
-        self.spoiler = False
-        self.cg = False
-
-    def get_texture(self):
-        texture = self.texture
+        # Mirrored region over the same texture, made the first time it's needed
+        self.flipped_texture = None
+        self.display_class = None
+        # Flipped -> texture shown for the current display class
+        self.display_textures = {}
+
+    def set_display_class(self, display_class):
+        if display_class != self.display_class:
+            self.display_class = display_class
+            self.display_textures = {}
+
+    def get_texture(self, flipped=False):
+        try:
+            return self.display_textures[flipped]
+        except KeyError:
+            pass
         if self.is_nsfw():
-            texture = self.return_nsfw_texture()
+            texture = self.return_nsfw_texture(flipped)
         elif self.is_spoiler():
-            texture = self.return_spoiler_texture()
-        return copy.copy(texture)
+            texture = self.return_spoiler_texture(flipped)
+        else:
+            texture = self.get_own_texture(flipped)
+        self.display_textures[flipped] = texture
+        return texture
 
-    def return_nsfw_texture(self):
+    def get_own_texture(self, flipped=False):
+        if not flipped:
+            return self.texture
+        if self.flipped_texture is None:
+            self.flipped_texture = self.texture.get_region(0, 0, self.texture.width, self.texture.height)
+            self.flipped_texture.flip_horizontal()
+        return self.flipped_texture
+
+    def return_nsfw_texture(self, flipped=False):
         spoiler_sprite = self.load_dummy_character_sprite('5')
-        return spoiler_sprite.get_texture()
+        return spoiler_sprite.get_texture(flipped)
 
-    def return_spoiler_texture(self):
+    def return_spoiler_texture(self, flipped=False):
         spoiler_sprite = self.load_dummy_character_sprite('4')
-        return spoiler_sprite.get_texture()
+        return spoiler_sprite.get_texture(flipped)
 
     def load_dummy_character_sprite(self, sprite_name):
         from MysteryOnline.character import characters
@@ -86,43 +124,30 @@ class Sprite:
         return self.name
 
     def is_nsfw(self):
-        return self.nsfw
+        return self.display_class == NSFW
 
     def set_nsfw(self):
-        try:
-            self.nsfw = True
-        except AttributeError:
-            pass
+        self.set_display_class(NSFW)
 
     def unset_nsfw(self):
-        try:
-            self.nsfw = False
-        except AttributeError:
-            pass
-        
+        if self.is_nsfw():
+            self.set_display_class(None)
+
     def unset_spoiler(self):
-        try:
-            self.spoiler = False
-        except AttributeError:
-            pass
+        if self.is_spoiler():
+            self.set_display_class(None)
 
     def set_spoiler(self):
-        try:
-            self.spoiler = True
-        except AttributeError:
-            pass
+        self.set_display_class(SPOILER)
 
     def is_spoiler(self):
-        return self.spoiler
+        return self.display_class == SPOILER
 
     def set_cg(self):
-        try:
-            self.cg = True
-        except AttributeError:
-            pass
+        self.set_display_class(CG)
 
     def is_cg(self):
-        return self.cg
+        return self.display_class == CG
 
 
 class SpriteSettings(BoxLayout):
@@ -132,31 +157,11 @@ class SpriteSettings(BoxLayout):
 
     def __init__(self, **kwargs):
         super(SpriteSettings, self).__init__(**kwargs)
-        self.functions = {"flip_h": self.flip_sprite}
-        self.activated = []
-        self.flipped = []
         self.pos_drop = None
         self.subloc_drop = None
         self.create_pos_drop()
         self.create_subloc_drop()
 
-    def apply_post_processing(self, sprite, setting):
-        try:
-            if setting == 0:
-                if sprite not in self.flipped:
-                    self.flip_sprite(sprite.texture)
-                    self.flipped.append(sprite)
-            else:
-                if sprite in self.flipped:
-                    self.flip_sprite(sprite.texture)
-                    self.flipped.remove(sprite)
-        except AttributeError:
-            pass
-        return sprite
-
-    def flip_sprite(self, sprite_texture):
-        sprite_texture.flip_horizontal()
-
     def on_checked_flip_h(self, value):
         user_handler = App.get_running_app().get_user_handler()
         if value:
@@ -164,8 +169,6 @@ class SpriteSettings(BoxLayout):
         else:
             user_handler.set_chosen_sprite_option(1)
         sprite = user_handler.get_chosen_sprite()
-        sprite_option = user_handler.get_chosen_sprite_option()
-        sprite = self.apply_post_processing(sprite, sprite_option)
         main_scr = App.get_running_app().get_main_screen()
         main_scr.sprite_preview.set_sprite(sprite)
         Clock.schedule_once(main_scr.refocus_text, 0.2)
@@ -244,20 +247,41 @@ class SpritePreview(Image):
         super(SpritePreview, self).__init__(**kwargs)
 
     def set_subloc(self, sub):
-        self.texture = sub.get_img().texture
+        self.texture = sub.get_texture()
 
     def set_sprite(self, sprite):
         user_handler = App.get_running_app().get_user_handler()
-        main_scr = App.get_running_app().get_main_screen()
         sprite_option = user_handler.get_chosen_sprite_option()
-        sprite = main_scr.sprite_settings.apply_post_processing(sprite, sprite_option)
         self.center_sprite.texture = None
-        self.center_sprite.texture = sprite.get_texture()
+        self.center_sprite.texture = sprite.get_texture(sprite_option == 0)
         self.center_sprite.opacity = 1
         self.center_sprite.size = (self.center_sprite.texture.width / 3,
                                    self.center_sprite.texture.height / 3)
 
 
+class SpriteLayer:
+    """One image of the SpriteWindow and what it showed last, a frame with the same inputs leaves it alone."""
+
+    def __init__(self, image):
+        self.image = image
+        self.key = None
+
+    def show(self, key, texture, size):
+        if key == self.key and texture is self.image.texture and self.image.opacity == 1:
+            return
+        self.key = key
+        self.image.texture = texture
+        self.image.size = size
+        self.image.opacity = 1
+
+    def hide(self):
+        if self.key is None and self.image.opacity == 0:
+            return
+        self.key = None
+        self.image.opacity = 0
+        self.image.texture = None
+
+
 class SpriteWindow(Widget):
     background = ObjectProperty(None)
     sprite_layout = ObjectProperty(None)
@@ -277,6 +301,11 @@ class SpriteWindow(Widget):
                              pos_hint={'center_x': 0.5, 'y': 0})
         self.overlay = Image(opacity=0, size_hint=(None, None), size=(800, 600),
                              pos_hint={'center_x': 0.5, 'y': 0})
+        self.center_layer = SpriteLayer(self.center_sprite)
+        self.left_layer = SpriteLayer(self.left_sprite)
+        self.right_layer = SpriteLayer(self.right_sprite)
+        self.foreground_layer = SpriteLayer(self.foreground)
+        self.overlay_layer = SpriteLayer(self.overlay)
         self.sprite_organizer.add_sprite(self.center_sprite)
         self.sprite_organizer.add_sprite(self.left_sprite)
         self.sprite_organizer.add_sprite(self.right_sprite)
@@ -301,7 +330,6 @@ class SpriteWindow(Widget):
         if char.name != 'Narrator':
             subloc.remove_o_user(user)
         if display_sub:
-            self.sprite_layout.clear_widgets()
             if char.name == 'Narrator':
                 self.sprite_organizer.add_sprite(self.foreground)
                 self.sprite_organizer.add_sprite(self.overlay)
@@ -322,10 +350,7 @@ class SpriteWindow(Widget):
                 self.sprite_organizer.add_sprite(self.foreground)
                 subloc.add_c_user(user)
 
-
-            for index, organized_sprite in enumerate(self.sprite_organizer.get_sprites()):
-                self.sprite_layout.add_widget(organized_sprite, index=index)
-
+            self.arrange_sprites()
             self.display_sub(subloc)
         else:
             if char.name == 'Narrator':
@@ -337,15 +362,23 @@ class SpriteWindow(Widget):
             else:
                 subloc.add_c_user(user)
 
+    def arrange_sprites(self):
+        # Only the images that aren't in the organizer's order yet are moved
+        children = self.sprite_layout.children
+        for index, organized_sprite in enumerate(self.sprite_organizer.get_sprites()):
+            if index < len(children) and children[index] is organized_sprite:
+                continue
+            if organized_sprite.parent is self.sprite_layout:
+                self.sprite_layout.remove_widget(organized_sprite)
+            self.sprite_layout.add_widget(organized_sprite, index=index)
+
     def set_cg(self, sprite, user):
-        self.set_all_sprites_opacity(0)
-        option = user.get_sprite_option()
-        main_scr = App.get_running_app().get_main_screen()
-        sprite = main_scr.sprite_settings.apply_post_processing(sprite, option)
-        self.center_sprite.texture = None
-        self.center_sprite.texture = sprite.get_texture()
-        self.center_sprite.opacity = 1
-        self.center_sprite.size = 800, 600
+        self.left_layer.hide()
+        self.right_layer.hide()
+        self.foreground_layer.hide()
+        self.overlay_layer.hide()
+        flipped = user.get_sprite_option() == 0
+        self.center_layer.show((user, sprite, flipped, CG), sprite.get_texture(flipped), (800, 600))
 
     def set_all_sprites_opacity(self, value: float):
         self.left_sprite.opacity = value
@@ -356,98 +389,60 @@ class SpriteWindow(Widget):
 
     def set_subloc(self, subloc):
         self.subloc = subloc
-        self.background.texture = subloc.get_img().texture
+        self.background.texture = subloc.get_texture()
+
+    @staticmethod
+    def get_standing_user(subloc, slot):
+        """The last user who took a slot of the sublocation, None if nobody is still there."""
+        user = subloc.get_top_user(slot)
+        if user is not None and user.get_subloc() != subloc:
+            subloc.remove_user(user, slot)
+            return None
+        return user
+
+    @staticmethod
+    def show_sprite(layer, user, sprite, subloc):
+        flipped = user.get_sprite_option() == 0
+        texture = sprite.get_texture(flipped)
+        layer.show((user, sprite, flipped, subloc), texture, texture.size)
 
     def display_sub(self, subloc: SubLocation):
         if subloc is None:
             return
-
-        main_scr = App.get_running_app().get_main_screen()
         self.subloc = subloc
-        if subloc.o_users:
-            user = subloc.get_o_user()
-            if user.get_subloc() == subloc:
-                sprite = user.get_current_sprite()
-                option = user.get_sprite_option()
-                sprite = main_scr.sprite_settings.apply_post_processing(sprite, option)
-                if sprite is not None:
-                    self.overlay.texture = None
-                    self.overlay.texture = sprite.get_texture()
-                    self.overlay.opacity = 1
-                    self.overlay.size = self.overlay.texture.size
-            else:
-                subloc.remove_o_user(user)
-                self.overlay.opacity = 0
-                self.overlay.texture = None
-        else:
-            self.overlay.texture = None
-            self.overlay.opacity = 0
+        user = self.get_standing_user(subloc, OVERLAY)
+        if user is None:
+            self.overlay_layer.hide()
+        elif user.get_current_sprite() is not None:
+            self.show_sprite(self.overlay_layer, user, user.get_current_sprite(), subloc)
 
-        self.foreground.opacity = 0
         if subloc.has_foreground():
-            self.foreground.texture = None
-            self.foreground.texture = subloc.get_foreground_img().texture
-            self.foreground.opacity = 1
-
-        if subloc.c_users:
-            user = subloc.get_c_user()
-            if user.get_subloc() == subloc:
-                sprite = user.get_current_sprite()
-                option = user.get_sprite_option()
-                sprite = main_scr.sprite_settings.apply_post_processing(sprite, option)
-                if sprite is not None:
-                    if sprite.is_cg():
-                        self.set_cg(sprite, subloc.get_c_user())
-                        return
-                    self.center_sprite.texture = None
-                    self.center_sprite.texture = sprite.get_texture()
-                    self.center_sprite.opacity = 1
-                    self.center_sprite.size = self.center_sprite.texture.size
-            else:
-                subloc.remove_c_user(user)
-                self.center_sprite.opacity = 0
-                self.center_sprite.texture = None
-        else:
-            self.center_sprite.texture = None
-            self.center_sprite.opacity = 0
-
-        if subloc.l_users:
-            user = subloc.get_l_user()
-            if user.get_subloc() == subloc:
-                sprite = user.get_current_sprite()
-                option = user.get_sprite_option()
-                sprite = main_scr.sprite_settings.apply_post_processing(sprite, option)
-                if sprite is not None:
-                    self.left_sprite.texture = None
-                    self.left_sprite.texture = sprite.get_texture()
-                    self.left_sprite.opacity = 1
-                    self.left_sprite.size = self.left_sprite.texture.size
-            else:
-                subloc.remove_l_user(user)
-                self.left_sprite.opacity = 0
-                self.left_sprite.texture = None
-        else:
-            self.left_sprite.texture = None
-            self.left_sprite.opacity = 0
-
-        if subloc.r_users:
-            user = subloc.get_r_user()
-            if user.get_subloc() == subloc:
-                sprite = user.get_current_sprite()
-                option = user.get_sprite_option()
-                sprite = main_scr.sprite_settings.apply_post_processing(sprite, option)
-                if sprite is not None:
-                    self.right_sprite.texture = None
-                    self.right_sprite.texture = sprite.get_texture()
-                    self.right_sprite.opacity = 1
-                    self.right_sprite.size = self.right_sprite.texture.size
-            else:
-                subloc.remove_r_user(user)
-                self.right_sprite.opacity = 0
-                self.right_sprite.texture = None
+            texture = subloc.get_foreground_texture()
+            self.foreground_layer.show(subloc, texture, self.foreground.size)
         else:
-            self.right_sprite.texture = None
-            self.right_sprite.opacity = 0
+            self.foreground_layer.hide()
+
+        user = self.get_standing_user(subloc, CENTER)
+        if user is None:
+            self.center_layer.hide()
+        elif user.get_current_sprite() is not None:
+            sprite = user.get_current_sprite()
+            if sprite.is_cg():
+                self.set_cg(sprite, user)
+                return
+            self.show_sprite(self.center_layer, user, sprite, subloc)
+
+        user = self.get_standing_user(subloc, LEFT)
+        if user is None:
+            self.left_layer.hide()
+        elif user.get_current_sprite() is not None:
+            self.show_sprite(self.left_layer, user, user.get_current_sprite(), subloc)
+
+        user = self.get_standing_user(subloc, RIGHT)
+        if user is None:
+            self.right_layer.hide()
+        elif user.get_current_sprite() is not None:
+            self.show_sprite(self.right_layer, user, user.get_current_sprite(), subloc)
 
     def refresh_sub(self):
         self.display_sub(self.subloc)
@@ -0,0 +1,228 @@
+"""Pre-decoded copies of the character atlas pages, so loading a page skips the PNG decode.
+
+Each page is stored in the cache folder as a header followed by its raw RGBA pixels.
+The header records the path, size, modification time and hash of the PNG it was made from,
+the copy is rebuilt when the PNG changes and removed when the PNG is gone.
+Raw pixels are much bigger than the PNGs, so the folder is kept within a byte budget,
+the copies used least recently are removed first.
+
+Run ``python -m MysteryOnline.sprite_cache`` to build the cache for every character ahead of time.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+if __name__ == '__main__':
+    # Keep Kivy from taking over the command line arguments
+    os.environ['KIVY_NO_ARGS'] = '1'
+
+from kivy.core.image import ImageData
+from kivy.logger import Logger
+
+CACHE_DIR = "spritecache"
+MAGIC = b'MOSC'
+VERSION = 2
+# magic, version, width, height, PNG modification time, PNG size, PNG sha1, length of the PNG path
+# The header is followed by the PNG path in UTF-8, then by the pixels
+HEADER = struct.Struct('<4sHIIQQ20sH')
+budget = 1024 * 1024 * 1024
+
+
+def set_budget(megabytes):
+    global budget
+    budget = int(megabytes) * 1024 * 1024
+
+
+def get_cache_path(page, cache_dir=CACHE_DIR):
+    name = hashlib.sha1(os.path.abspath(page).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, name + ".rgba")
+
+
+def hash_file(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.digest()
+
+
+def read_header(cache_path):
+    """Returns (magic, version, width, height, mtime, size, sha1, PNG path) or None when it isn't a valid copy."""
+    try:
+        with open(cache_path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            header = HEADER.unpack(header)
+            if header[0] != MAGIC or header[1] != VERSION:
+                return None
+            path = f.read(header[7])
+    except OSError:
+        return None
+    try:
+        return header[:7] + (path.decode('utf-8'),)
+    except UnicodeDecodeError:
+        return None
+
+
+def pack_header(page, width, height, mtime, size, digest):
+    path = os.path.abspath(page).encode('utf-8')
+    return HEADER.pack(MAGIC, VERSION, width, height, mtime, size, digest, len(path)) + path
+
+
+def is_fresh(page, cache_path):
+    """Whether the cached copy still matches the PNG, a changed modification time alone doesn't invalidate it."""
+    header = read_header(cache_path)
+    if header is None:
+        return False
+    stat = os.stat(page)
+    width, height, mtime, size, digest, path = header[2:]
+    data_size = width * height * 4
+    if stat.st_size != size or os.path.getsize(cache_path) != HEADER.size + len(path.encode('utf-8')) + data_size:
+        return False
+    if stat.st_mtime_ns == mtime:
+        return True
+    if hash_file(page) != digest:
+        return False
+    # Same pixels, only touched: remember the new time so the next check is cheap again
+    with open(cache_path, 'r+b') as f:
+        f.write(pack_header(page, width, height, stat.st_mtime_ns, size, digest))
+    return True
+
+
+def build(page, cache_dir=CACHE_DIR):
+    """Decodes the PNG and writes its cached copy, returns the pixels as (width, height, data)."""
+    from PIL import Image
+    stat = os.stat(page)
+    with Image.open(page) as image:
+        image = image.convert('RGBA')
+        width, height = image.size
+        data = image.tobytes()
+    cache_path = get_cache_path(page, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(pack_header(page, width, height, stat.st_mtime_ns, stat.st_size, hash_file(page)))
+            f.write(data)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        Logger.warning('SpriteCache: Could not write ' + cache_path)
+    else:
+        trim(cache_dir, keep=cache_path)
+    return width, height, data
+
+
+def remove(cache_path):
+    try:
+        os.remove(cache_path)
+    except OSError:
+        # Still mapped on Windows, it goes on the next prune
+        return False
+    return True
+
+
+def trim(cache_dir=CACHE_DIR, keep=None):
+    """Removes the copies used least recently until the folder fits in the budget."""
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith(".rgba")]
+    except OSError:
+        return
+    entries = [(entry.stat().st_mtime_ns, entry.stat().st_size, entry.path) for entry in entries]
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        if path != keep and remove(path):
+            Logger.debug('SpriteCache: Evict <%s>' % path)
+            total -= size
+
+
+def prune(cache_dir=CACHE_DIR):
+    """Removes the copies of PNGs that were deleted or changed and unfinished writes, then trims to the budget."""
+    try:
+        entries = list(os.scandir(cache_dir))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.endswith(".tmp"):
+            remove(entry.path)
+            continue
+        if not entry.name.endswith(".rgba"):
+            continue
+        header = read_header(entry.path)
+        try:
+            orphaned = header is None or entry.path != get_cache_path(header[7], cache_dir) or \
+                not is_fresh(header[7], entry.path)
+        except OSError:
+            orphaned = True
+        if orphaned:
+            Logger.debug('SpriteCache: Prune <%s>' % entry.path)
+            remove(entry.path)
+    trim(cache_dir)
+
+
+def load(page, cache_dir=CACHE_DIR):
+    """Returns the pixels of an atlas page as ImageData, ready to be uploaded to a texture.
+
+    Safe to call from a worker thread.
+    """
+    cache_path = get_cache_path(page, cache_dir)
+    # The rows are stored top first like Kivy's own loaders give them, so the texture is flipped the same way
+    if is_fresh(page, cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                # A private mapping, Kivy only takes writable buffers but never writes to it
+                pixels = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            # The modification time of the copy tells trim() when it was last used
+            os.utime(cache_path)
+        except OSError:
+            # Removed by a prune in the meantime
+            pass
+        else:
+            header = HEADER.unpack_from(pixels)
+            width, height, offset = header[2], header[3], HEADER.size + header[7]
+            return ImageData(width, height, 'rgba', memoryview(pixels)[offset:], source=page, flip_vertical=True)
+    Logger.debug('SpriteCache: Build <%s>' % page)
+    width, height, data = build(page, cache_dir)
+    return ImageData(width, height, 'rgba', data, source=page, flip_vertical=True)
+
+
+def get_pages(characters_dir):
+    for name in sorted(os.listdir(characters_dir)):
+        atlas = os.path.join(characters_dir, name, "sprites.atlas")
+        try:
+            with open(atlas, 'r') as fd:
+                meta = json.load(fd)
+        except (OSError, ValueError):
+            continue
+        for sub in meta:
+            yield os.path.join(characters_dir, name, sub)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Builds the sprite cache of every character.")
+    parser.add_argument('characters', nargs='?', default="characters", help="folder containing the characters")
+    parser.add_argument('--cache', default=CACHE_DIR, help="cache folder")
+    parser.add_argument('--budget', type=int, default=budget // (1024 * 1024), help="size limit in megabytes")
+    args = parser.parse_args(argv)
+    set_budget(args.budget)
+    prune(args.cache)
+    built = 0
+    for page in get_pages(args.characters):
+        try:
+            if not is_fresh(page, get_cache_path(page, args.cache)):
+                build(page, args.cache)
+                built += 1
+                print("Built", page)
+        except OSError as e:
+            print("Skipped {}: {}".format(page, e), file=sys.stderr)
+    print("{} pages built".format(built))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,61 @@ import re
 from MysteryOnline.commands import command_processor, CommandInvalidArgumentsError, CommandNoArgumentsError
 from MysteryOnline.mopopup import MOPopup
 
+# A markup tag, an escaped character or any single character
+TEXT_TOKEN = re.compile(r'\[[^\]]+\]|&\w+;|.', re.DOTALL)
+
+
+def get_cutoffs(text):
+    """Lengths of text that end right after each visible character, so a reveal never splits a tag or entity."""
+    cutoffs = []
+    for token in TEXT_TOKEN.finditer(text):
+        if len(token.group()) > 1 and token.group().startswith('['):
+            # Tags take no room, they're shown along with the next character
+            continue
+        cutoffs.append(token.end())
+    if cutoffs:
+        # Closing tags after the last character
+        cutoffs[-1] = len(text)
+    return cutoffs
+
+
+class Typewriter:
+    """Reveals a message at a number of characters per second, however often it's ticked.
+
+    Several characters can show up in one tick, the label only has to be laid out once per tick.
+    Blips follow their own cadence instead of one per character.
+    """
+
+    def __init__(self, text, speed, blip_interval=0.05):
+        self.text = text
+        self.cutoffs = get_cutoffs(text)
+        self.speed = speed
+        self.blip_interval = blip_interval
+        self.elapsed = 0
+        self.shown = 0
+        self.last_blip = None
+
+    def advance(self, dt):
+        """Returns the text to show now, None if it didn't change, and whether to blip."""
+        self.elapsed += dt
+        shown = min(len(self.cutoffs), int(self.elapsed * self.speed))
+        if shown <= self.shown:
+            return None, False
+        self.shown = shown
+        blip = self.last_blip is None or self.elapsed - self.last_blip >= self.blip_interval
+        if blip:
+            self.last_blip = self.elapsed
+        return self.text[:self.cutoffs[shown - 1]], blip
+
+    def is_done(self):
+        return self.shown >= len(self.cutoffs)
+
 
 class TextBox(Label):
+    # The label is laid out at most this many times per second while typing, well below the
+    # usual typing speed so each layout reveals several characters
+    max_tick_rate = 20
+
     char_name = ObjectProperty(None)
 
     def __init__(self, **kwargs):
@@ -28,7 +81,9 @@ class TextBox(Label):
         self.prev_user = None
         self.is_displaying_msg = False
         self.markup = True
-        self.gen = None
+        self.typewriter = None
+        self.typewriter_event = None
+        self.typed_base = ""  # Text already in the box when the typed message started
         self.sfx = {}
         self.volume = 1.0
         self.sfx_volume = 1.0
@@ -109,9 +164,9 @@ class TextBox(Label):
         App.get_running_app().play_sound(sfx, volume=v)
 
     def display_text(self, msg, user, color, sender):
-        self.is_displaying_msg = True
         if self.prev_user is not user or (len(self.text) + len(msg) > 240):
             self.clear_textbox()
+        self.is_displaying_msg = True
         self.prev_user = user
         config = App.get_running_app().config
         if config.getint('display', 'rpg_mode') == 1:
@@ -122,17 +177,15 @@ class TextBox(Label):
         self.msg = msg
         user.color = color
 
-        def text_gen(text):
-            for c in text:
-                yield c
-
         config = App.get_running_app().config
         if user.color == 'ffffff' and config.getint('other', 'instant_text') == 0:
-            self.gen = text_gen(self.msg)
-            config = App.get_running_app().config
             speed = config.getdefaultint('other', 'textbox_speed', 60)
             self.sfx["ffffff"].volume = self.volume
-            Clock.schedule_interval(self._animate, 1.0 / speed)
+            if self.typewriter_event is not None:
+                self.typewriter_event.cancel()
+            self.typewriter = Typewriter(self.msg, speed)
+            self.typed_base = self.text
+            self.typewriter_event = Clock.schedule_interval(self._animate, 1.0 / min(speed, self.max_tick_rate))
         else:
             if user.color in self.sfx:
                 App.get_running_app().play_sound(self.sfx[user.color], volume=self.sfx_volume)
@@ -170,13 +223,16 @@ class TextBox(Label):
         user.colored = False
 
     def _animate(self, dt):
-        try:
+        text, blip = self.typewriter.advance(dt)
+        if blip:
             self.sfx["ffffff"].play()
             self.sfx["ffffff"].seek(0)
-            self.text += next(self.gen)
-        except StopIteration:
+        if text is not None:
+            self.text = self.typed_base + text
+        if self.typewriter.is_done():
             self.text += " "
             self.is_displaying_msg = False
+            self.typewriter_event = None
             return False
 
     def unload_blip(self, delta):
@@ -184,6 +240,13 @@ class TextBox(Label):
             self.sfx["ffffff"].unload()
 
     def clear_textbox(self):
+        # Whatever was still being typed goes too, or the next tick would bring the old text back
+        if self.typewriter_event is not None:
+            self.typewriter_event.cancel()
+            self.typewriter_event = None
+            self.is_displaying_msg = False
+        self.typewriter = None
+        self.typed_base = ""
         self.text = ""
 
     def on_volume_change(self, s, k, v):
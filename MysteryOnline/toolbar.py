@@ -75,6 +75,16 @@ class Toolbar(BoxLayout):
             if file.endswith('wav'):
                 self.sfx_list.append(file)
 
+    def refresh_sfx(self):
+        sfx_list = self.sfx_list
+        self.sfx_list = []
+        self.load_sfx()
+        if self.sfx_list == sfx_list:
+            return
+        self.sfx_main_btn.unbind(on_release=self.sfx_dropdown.open)
+        self.sfx_dropdown.clear_widgets()
+        self.create_sfx_dropdown()
+
     def create_sfx_dropdown(self):
         self.sfx_dropdown = DropDown(scroll_type=["bars", "content"], effect_cls="ScrollEffect", bar_width=10)
         fav_sfx = App.get_running_app().get_fav_sfx()
@@ -1,13 +1,62 @@
 from MysteryOnline.character import characters
-from MysteryOnline.location import location_manager
+from MysteryOnline.location import location_manager, location_textures
 from MysteryOnline.inventory import UserInventory
 
 from kivy.app import App
 
-from MysteryOnline.location import Location
+from MysteryOnline.location import Location, get_pos_slot
 from MysteryOnline.sprite import Sprite
 
 
+class PresenceIndex:
+    """Who is in which location and sublocation, kept up to date by User so rooms never have to be scanned."""
+
+    def __init__(self):
+        self.locations = {}  # Location name -> {user: None}
+        self.sublocations = {}  # (location name, sublocation name) -> {user: None}
+        self.user_rooms = {}  # User -> (location name, sublocation name)
+
+    def move(self, user, loc_name, subloc_name):
+        room = loc_name, subloc_name
+        if self.user_rooms.get(user) == room:
+            return
+        self.remove(user)
+        self.user_rooms[user] = room
+        self.locations.setdefault(loc_name, {})[user] = None
+        self.sublocations.setdefault(room, {})[user] = None
+
+    def remove(self, user):
+        room = self.user_rooms.pop(user, None)
+        if room is None:
+            return
+        self.discard(self.locations, room[0], user)
+        self.discard(self.sublocations, room, user)
+
+    @staticmethod
+    def discard(rooms, key, user):
+        users = rooms[key]
+        del users[user]
+        if not users:
+            del rooms[key]
+
+    def get_loc_name(self, user):
+        room = self.user_rooms.get(user)
+        return None if room is None else room[0]
+
+    def in_same_location(self, user, other):
+        loc_name = self.get_loc_name(user)
+        return loc_name is not None and loc_name == self.get_loc_name(other)
+
+    def get_location_users(self, loc_name):
+        return list(self.locations.get(loc_name, ()))
+
+    def get_sublocation_users(self, loc_name, subloc_name):
+        return list(self.sublocations.get((loc_name, subloc_name), ()))
+
+
+presence = PresenceIndex()
+
+
 class User:
     def __init__(self, username):
         self.username = username
@@ -16,6 +65,7 @@ class User:
         self.subloc = None
         self.pos = "center"
         self.current_sprite = None
+        self.recent_sprites = []  # Names of the last sprites used, most recent first
         self.prev_subloc = None
         self.color = 'ffffff'  # Default color for text
         self.colored = None  # True for a color selected
@@ -71,6 +121,13 @@ class User:
             self.colored = False
 
     def set_current_sprite(self, num):
+        if self.current_sprite is not None and self.current_sprite != num:
+            if self.current_sprite in self.recent_sprites:
+                self.recent_sprites.remove(self.current_sprite)
+            self.recent_sprites.insert(0, self.current_sprite)
+            del self.recent_sprites[4:]
+        if num in self.recent_sprites:
+            self.recent_sprites.remove(num)
         self.current_sprite = num
 
     def get_current_sprite(self) -> Sprite:
@@ -97,6 +154,7 @@ class User:
                 self.location = locations[loc]
             else:
                 self.location = None
+                presence.remove(self)
                 return
         else:
             self.location = loc
@@ -106,24 +164,16 @@ class User:
     def set_subloc(self, subloc):
         self.prev_subloc = self.subloc
         self.subloc = subloc
+        if self.location is not None and subloc is not None:
+            presence.move(self, self.location.name, subloc.name)
 
     def set_pos(self, pos):
         if self.pos is not None:
-            if self.pos == 'right':
-                if self.prev_subloc is not None and self in self.prev_subloc.r_users:
-                    self.prev_subloc.remove_r_user(self)
-                elif self in self.subloc.r_users:
-                    self.subloc.remove_r_user(self)
-            elif self.pos == 'left':
-                if self.prev_subloc is not None and self in self.prev_subloc.l_users:
-                    self.prev_subloc.remove_l_user(self)
-                elif self in self.subloc.l_users:
-                    self.subloc.remove_l_user(self)
+            slot = get_pos_slot(self.pos)
+            if self.prev_subloc is not None and self.prev_subloc.get_slot(self) == slot:
+                self.prev_subloc.remove_user(self, slot)
             else:
-                if self.prev_subloc is not None and self in self.prev_subloc.c_users:
-                    self.prev_subloc.remove_c_user(self)
-                elif self in self.subloc.c_users:
-                    self.subloc.remove_c_user(self)
+                self.subloc.remove_user(self, slot)
         self.pos = pos
 
     def set_sprite_option(self, option):
@@ -150,12 +200,7 @@ class User:
     def remove(self):
         if self.pos is None or self.subloc is None:
             return
-        if self.pos == 'right':
-            self.subloc.remove_r_user(self)
-        elif self.pos == 'left':
-            self.subloc.remove_l_user(self)
-        else:
-            self.subloc.remove_c_user(self)
+        self.subloc.remove_user(self, get_pos_slot(self.pos))
 
     def set_choice_popup_state(self, boolean):
         self.has_choice_popup = boolean
@@ -221,6 +266,7 @@ class CurrentUserHandler:
 
     def on_current_loc(self, *args):
         self.user.set_loc(self.current_loc)
+        location_textures.warm(self.current_loc.get_texture_paths())
         subloc_name = self.current_loc.get_first_sub()
         self.set_chosen_subloc_name(subloc_name)
         message_factory = App.get_running_app().get_message_factory()
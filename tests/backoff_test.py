@@ -0,0 +1,24 @@
+import unittest
+from MysteryOnline.irc_mo import Backoff
+
+
+class BackoffTests(unittest.TestCase):
+
+    def test_delays_grow_until_cap(self):
+        backoff = Backoff(base=2, cap=10)
+        self.assertTrue(1 <= backoff.next_delay() <= 2)
+        self.assertTrue(2 <= backoff.next_delay() <= 4)
+        self.assertTrue(4 <= backoff.next_delay() <= 8)
+        self.assertTrue(5 <= backoff.next_delay() <= 10)
+        self.assertTrue(5 <= backoff.next_delay() <= 10)
+
+    def test_reset(self):
+        backoff = Backoff(base=2, cap=10)
+        for i in range(5):
+            backoff.next_delay()
+        backoff.reset()
+        self.assertTrue(1 <= backoff.next_delay() <= 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from MysteryOnline import character
+from MysteryOnline.character import CharacterRegistry, main_series_list, characters, get_whitelisted_series, \
+    on_sprite_config_change
+
+SETTINGS = """[character]
+name = {0}
+series = {1}
+sprites = sprites.atlas
+icons = icons.atlas
+
+[nsfw]
+sprites = 3,4
+"""
+
+
+class FakeUser:
+
+    def __init__(self, char):
+        self.char = char
+        self.sprite = None
+
+    def get_char(self):
+        return self.char
+
+    def set_char(self, char):
+        self.char = char
+
+    def set_current_sprite(self, sprite):
+        self.sprite = sprite
+
+
+class CharacterRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.folder, "index.json")
+        self.write_character("Alice", "Alice", "Wonderland")
+        self.write_character("Bob", "Bob", "Builders")
+        self.registry = CharacterRegistry(self.folder, self.index_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_character(self, folder, name, series):
+        os.makedirs(os.path.join(self.folder, folder), exist_ok=True)
+        with open(os.path.join(self.folder, folder, "settings.ini"), 'w') as f:
+            f.write(SETTINGS.format(name, series))
+
+    def test_characters_are_built_on_access(self):
+        self.assertEqual(["Alice", "Bob"], sorted(self.registry))
+        self.assertEqual({}, self.registry.loaded)
+        self.assertIn("Builders", main_series_list)
+        alice = self.registry["Alice"]
+        self.assertEqual("Wonderland", alice.series)
+        self.assertIn("4", alice.nsfw_sprites)
+        self.assertIs(alice, self.registry["Alice"])
+        self.assertIsNone(self.registry.get("Carol"))
+
+    def test_unchanged_settings_come_from_the_index(self):
+        self.registry.scan()
+        settings = os.path.join(self.folder, "Alice", "settings.ini")
+        stat = os.stat(settings)
+        self.write_character("Alice", "Not Alice", "Wonderland")
+        os.utime(settings, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual("Alice", CharacterRegistry(self.folder, self.index_file)["Alice"].display_name)
+        os.utime(settings, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual("Not Alice", CharacterRegistry(self.folder, self.index_file)["Alice"].display_name)
+
+    def test_refresh_keeps_unchanged_characters(self):
+        alice = self.registry["Alice"]
+        bob = self.registry["Bob"]
+        settings = os.path.join(self.folder, "Bob", "settings.ini")
+        stat = os.stat(settings)
+        self.write_character("Bob", "Robert", "Builders")
+        os.utime(settings, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.write_character("Carol", "Carol", "Wonderland")
+        self.assertEqual({"Bob", "Carol"}, self.registry.refresh())
+        self.assertIs(alice, self.registry["Alice"])
+        self.assertIsNot(bob, self.registry["Bob"])
+        self.assertEqual("Robert", self.registry["Bob"].display_name)
+
+
+    def test_users_follow_refreshed_characters(self):
+        old_bob = self.registry["Bob"]
+        user = FakeUser(old_bob)
+        settings = os.path.join(self.folder, "Bob", "settings.ini")
+        stat = os.stat(settings)
+        self.write_character("Bob", "Robert", "Builders")
+        os.utime(settings, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.registry.rebind([user], self.registry.refresh())
+        self.assertIs(self.registry["Bob"], user.get_char())
+        self.assertIsNot(old_bob, user.get_char())
+        self.assertTrue(user.get_char().loaded_sprites)
+
+
+
+class WhitelistTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+        with open("mysteryonline.ini", 'w') as f:
+            f.write("[other]\nwhitelisted_series = ['Builders']\n")
+        os.makedirs(os.path.join("characters", "Alice"))
+        with open(os.path.join("characters", "Alice", "settings.ini"), 'w') as f:
+            f.write(SETTINGS.format("Alice", "Wonderland") + "\n[spoiler]\nsprites = 5\n")
+        character.whitelist_cache = None
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+        character.whitelist_cache = None
+
+    def test_changed_whitelist_applies_before_the_ini_is_written(self):
+        alice = CharacterRegistry("characters", "index.json")["Alice"]
+        self.assertEqual(['Builders'], get_whitelisted_series())
+        self.assertIn("5", alice.spoiler_sprites)
+        with mock.patch.dict(characters.loaded, {"Alice": alice}):
+            on_sprite_config_change('other', 'whitelisted_series', "['Builders', 'Wonderland']")
+        self.assertEqual(['Builders', 'Wonderland'], get_whitelisted_series())
+        self.assertNotIn("5", alice.spoiler_sprites)
+
+
+if __name__ == '__main__':
+    unittest.main()
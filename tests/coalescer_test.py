@@ -0,0 +1,50 @@
+import unittest
+from MysteryOnline.irc_mo import MessageCoalescer, IconMessage, LocationMessage, ChatMessage
+
+
+def icon(sender, sprite):
+    return IconMessage(sender, location="Hakuryou", sublocation="Aqua1", character="RedHerring", sprite=sprite,
+                       position="center", sprite_option=1, dance=False)
+
+
+class MessageCoalescerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = MessageCoalescer()
+
+    def test_latest_icon_wins(self):
+        first = icon("Test", "1")
+        self.assertFalse(self.coalescer.offer(first))
+        self.assertTrue(self.coalescer.offer(icon("Test", "2")))
+        self.assertTrue(self.coalescer.offer(icon("Test", "3")))
+        self.assertEqual("3", first.sprite)
+        self.assertEqual(2, self.coalescer.collapsed)
+
+    def test_chat_ends_the_run(self):
+        first = icon("Test", "1")
+        self.coalescer.offer(first)
+        self.assertFalse(self.coalescer.offer(ChatMessage("Test", content="hi")))
+        self.assertFalse(self.coalescer.offer(icon("Test", "2")))
+        self.assertEqual("1", first.sprite)
+        self.assertEqual(0, self.coalescer.collapsed)
+
+    def test_senders_are_independent(self):
+        self.coalescer.offer(icon("Test", "1"))
+        self.assertFalse(self.coalescer.offer(icon("Other", "1")))
+        self.assertTrue(self.coalescer.offer(icon("Other", "2")))
+
+    def test_different_types_are_not_merged(self):
+        self.coalescer.offer(icon("Test", "1"))
+        self.assertFalse(self.coalescer.offer(LocationMessage("Test", "Hakuryou")))
+        self.assertTrue(self.coalescer.offer(LocationMessage("Test", "Elsewhere")))
+
+    def test_released_message_is_not_merged_into(self):
+        first = icon("Test", "1")
+        self.coalescer.offer(first)
+        self.coalescer.release(first)
+        self.assertFalse(self.coalescer.offer(icon("Test", "2")))
+        self.assertEqual("1", first.sprite)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Microbenchmark for MessageFactory.build_from_irc.
+
+Run from the repository root with `python -m tests.decoder_benchmark`.
+The corpus mirrors the mix of a busy channel: mostly nullposts and chat lines,
+with presence, OOC and music messages in between.
+
+The prefix lookup is compared with the chain of checks it replaced, both
+building the same message objects so only the dispatch differs.
+"""
+import random
+import timeit
+
+from MysteryOnline.irc_mo import MessageFactory, ChatMessage, IconMessage, CharacterMessage, LOOCMessage, \
+    OOCMessage, MusicMessage, LocationMessage, RollMessage, ItemMessage, ClearMessage, ChoiceMessage, \
+    ChoiceReturnMessage
+
+CORPUS_SAMPLES = [
+    (40, "sc#Hakuryou#Aqua{0}#RedHerring#{1}#center#1#False"),
+    (25, "Hakuryou#Aqua{0}#RedHerring#{1}#left#0#0#0#Well, that's one way to look at it. #{1}"),
+    (10, "OOC#brb, making tea {0}"),
+    (8, "l#Hakuryou"),
+    (8, "c#RedHerring#https://example.com/RedHerring.zip#1.{0}"),
+    (3, "LOOC#Hakuryou#did anyone see where {0} went?"),
+    (3, "m#Track {0}#https://example.com/track{1}.mp3"),
+    (2, "r#1d20: {0}"),
+    (1, "cl#Hakuryou"),
+]
+
+
+def build_corpus(size=10000, seed=0):
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in CORPUS_SAMPLES]
+    templates = [template for _, template in CORPUS_SAMPLES]
+    return [rng.choices(templates, weights)[0].format(rng.randint(1, 4), rng.randint(1, 60)) for _ in range(size)]
+
+
+def chain_build_from_irc(irc_message, username):
+    """The decoder before the prefix lookup, testing each prefix in turn."""
+    if irc_message.count('#') >= 8:
+        return ChatMessage.from_irc(irc_message, username)
+    for prefix, message_type in (("sc#", IconMessage), ('c#', CharacterMessage), ('LOOC#', LOOCMessage),
+                                 ('OOC#', OOCMessage), ('m#', MusicMessage), ('l#', LocationMessage),
+                                 ('r#', RollMessage), ('i#', ItemMessage), ('cl#', ClearMessage),
+                                 ('ch#', ChoiceMessage), ('ch2#', ChoiceReturnMessage)):
+        if irc_message.startswith(prefix):
+            return message_type.from_irc(irc_message, username)
+    return OOCMessage(username, irc_message)
+
+
+def measure(decode, corpus, runs=20):
+    def decode_all():
+        for line in corpus:
+            decode(line, "Test")
+
+    return min(timeit.repeat(decode_all, number=1, repeat=runs))
+
+
+def main():
+    corpus = build_corpus()
+    runs = 20
+    baseline = measure(chain_build_from_irc, corpus, runs)
+    current = measure(MessageFactory().build_from_irc, corpus, runs)
+    print("{} messages, best of {}:".format(len(corpus), runs))
+    for name, best in (("prefix chain", baseline), ("prefix lookup", current)):
+        print("  {:<14} {:.2f} ms ({:.2f} us/message)".format(name, best * 1000, best * 1e6 / len(corpus)))
+    print("  speedup        {:.2f}x".format(baseline / current))
+
+
+if __name__ == "__main__":
+    main()
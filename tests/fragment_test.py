@@ -0,0 +1,95 @@
+import unittest
+from itertools import zip_longest
+from MysteryOnline.irc_mo import FragmentAssembler, MessageFactory, ChatMessage, OOCMessage, frame, split_utf8, \
+    get_fragment_key
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FramingTests(unittest.TestCase):
+
+    def test_short_text_is_left_alone(self):
+        self.assertEqual(["hello"], frame("hello", 50))
+
+    def test_pieces_fit_in_bytes(self):
+        text = "ü" * 100
+        pieces = split_utf8(text, 33)
+        self.assertEqual(text, ''.join(pieces))
+        for piece in pieces:
+            self.assertLessEqual(len(piece.encode('utf-8')), 33)
+
+    def test_split_prefers_spaces(self):
+        self.assertEqual(["hello ", "world"], split_utf8("hello world", 8))
+
+    def test_headers(self):
+        fragments = frame("a" * 30, 20)
+        self.assertEqual(3, len(fragments))
+        self.assertTrue(fragments[0].startswith("[1/3] "))
+        self.assertTrue(fragments[2].startswith("[3/3] "))
+
+    def test_message_lines(self):
+        message = OOCMessage("Test", "word " * 100)
+        lines = message.to_irc_lines(120)
+        self.assertGreater(len(lines), 1)
+        factory = MessageFactory()
+        assembler = FragmentAssembler()
+        whole = None
+        for line in lines:
+            self.assertLessEqual(len(line.encode('utf-8')), 120)
+            received = factory.build_from_irc(line, "Test")
+            self.assertIsInstance(received, OOCMessage)
+            whole = assembler.feed(("Test", received.prefix), received.content, received)
+        self.assertEqual("word " * 100, whole[0])
+
+
+class FragmentAssemblerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.assembler = FragmentAssembler(timeout=5, clock=self.clock)
+
+    def test_plain_text_passes_through(self):
+        self.assertEqual(("hi", None), self.assembler.feed("Test", "hi"))
+
+    def test_out_of_order(self):
+        self.assertIsNone(self.assembler.feed("Test", "[2/2] world"))
+        self.assertEqual(("hello world", None), self.assembler.feed("Test", "[1/2] hello "))
+
+    def test_timeout_keeps_what_arrived(self):
+        self.assembler.feed("Test", "[1/3] hello ")
+        self.assembler.feed("Test", "[3/3] !")
+        self.assertEqual([], self.assembler.expire())
+        self.clock.now = 6
+        self.assertEqual([("Test", "hello !", None)], self.assembler.expire())
+        self.assertEqual({}, self.assembler.pending)
+
+    def test_chat_and_private_messages_are_apart(self):
+        chat = ChatMessage("Test", "Hakuryou", "Aqua1", "RedHerring", "4", "center", "0", "0", "0", "chat " * 60)
+        chat_lines = chat.to_irc_lines(120)
+        private_lines = frame("secret " * 60, 120)
+        self.assertGreater(len(chat_lines), 1)
+        self.assertGreater(len(private_lines), 1)
+        factory = MessageFactory()
+        received = {}
+        for chat_line, private_line in zip_longest(chat_lines, private_lines):
+            if chat_line is not None:
+                message = factory.build_from_irc(chat_line, "Test")
+                whole = self.assembler.feed(get_fragment_key("Test", message), message.content, message)
+                if whole is not None:
+                    received['chat'] = whole[0]
+            if private_line is not None:
+                whole = self.assembler.feed(get_fragment_key("Test"), private_line)
+                if whole is not None:
+                    received['private'] = whole[0]
+        self.assertEqual({'chat': "chat " * 60, 'private': "secret " * 60}, received)
+
+
+if __name__ == '__main__':
+    unittest.main()
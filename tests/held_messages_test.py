@@ -0,0 +1,46 @@
+import unittest
+from MysteryOnline.irc_mo import HeldMessages, ChatMessage, IconMessage, LocationMessage
+
+
+class HeldMessagesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.held = HeldMessages()
+
+    def test_chat_waits_while_busy(self):
+        chat = ChatMessage("Test", content="hi")
+        self.assertTrue(self.held.hold(chat, busy=True))
+        self.assertIsNone(self.held.next(busy=True))
+        self.assertIs(chat, self.held.next(busy=False))
+        self.assertIsNone(self.held.next(busy=False))
+
+    def test_chat_runs_when_idle(self):
+        self.assertFalse(self.held.hold(ChatMessage("Test", content="hi"), busy=False))
+
+    def test_later_messages_of_the_sender_wait(self):
+        chat = ChatMessage("Test", content="hi")
+        move = LocationMessage("Test", "Elsewhere")
+        self.held.hold(chat, busy=True)
+        self.assertTrue(self.held.hold(move, busy=True))
+        self.assertIs(chat, self.held.next(busy=False))
+        # The move follows the line it came after, even though the textbox is busy again
+        self.assertIs(move, self.held.next(busy=True))
+        self.assertEqual({}, self.held.senders)
+
+    def test_other_senders_flow_past(self):
+        self.held.hold(ChatMessage("Test", content="hi"), busy=True)
+        self.assertFalse(self.held.hold(IconMessage("Other", sprite="2"), busy=True))
+        self.assertTrue(self.held.hold(ChatMessage("Other", content="hello"), busy=True))
+
+    def test_chat_keeps_its_order(self):
+        first = ChatMessage("Test", content="first")
+        second = ChatMessage("Other", content="second")
+        self.held.hold(first, busy=True)
+        # Not busy anymore, but an older line is still waiting
+        self.assertTrue(self.held.hold(second, busy=False))
+        self.assertIs(first, self.held.next(busy=False))
+        self.assertIs(second, self.held.next(busy=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import time
+import unittest
+from kivy.clock import Clock
+from MysteryOnline.icarus import Icarus, PageCache, page_cache
+from MysteryOnline.sprite import NullSprite, Sprite
+
+PATH = "characters/RedHerring/sprites.atlas"
+
+
+class IcarusIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.sprites = Icarus(PATH)
+
+    def test_index_is_lazy(self):
+        self.assertIsNone(self.sprites.index)
+        self.assertEqual({}, self.sprites.textures)
+
+    def test_page_is_loaded_once(self):
+        first = self.sprites['4']
+        self.assertIsInstance(first, Sprite)
+        page = self.sprites.index['4'][0]
+        self.assertTrue(all(name in self.sprites for name in self.sprites.pages[page]))
+        self.sprites.load_page(page)
+        self.assertIs(first, self.sprites['4'])
+
+    def test_unknown_sprite(self):
+        self.assertIsInstance(self.sprites['not a sprite'], NullSprite)
+
+    def test_asynchronous_page(self):
+        sprites = Icarus(PATH, asynchronous=True)
+        loaded = []
+        sprites.bind(on_page_loaded=lambda atlas, page: loaded.append(page))
+        self.assertIsInstance(sprites['4'], NullSprite)
+        deadline = time.monotonic() + 10
+        while sprites.decoding and time.monotonic() < deadline:
+            Clock.tick()
+        self.assertIsInstance(sprites['4'], Sprite)
+        self.assertEqual([sprites.index['4'][0]], loaded)
+
+
+class FakeTexture:
+    width = 512
+    height = 512
+
+
+class FakeAtlas:
+
+    def __init__(self):
+        self.unloaded = []
+
+    def unload_page(self, page):
+        self.unloaded.append(page)
+
+
+class PageCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pinned = set()
+        self.cache = PageCache(budget=2 * 512 * 512 * 4, get_pinned=lambda: self.pinned)
+
+    def test_least_recently_used_is_evicted(self):
+        atlas = FakeAtlas()
+        self.cache.add(atlas, "a", FakeTexture())
+        self.cache.add(atlas, "b", FakeTexture())
+        self.cache.touch(atlas, "a")
+        self.cache.add(atlas, "c", FakeTexture())
+        self.assertEqual(["b"], atlas.unloaded)
+        self.assertEqual(2 * 512 * 512 * 4, self.cache.size)
+
+    def test_pinned_atlases_are_kept(self):
+        pinned, other = FakeAtlas(), FakeAtlas()
+        self.pinned.add(pinned)
+        self.cache.add(pinned, "a", FakeTexture())
+        self.cache.add(other, "b", FakeTexture())
+        self.cache.add(pinned, "c", FakeTexture())
+        self.assertEqual([], pinned.unloaded)
+        self.assertEqual(["b"], other.unloaded)
+
+    def test_added_page_is_kept_over_budget(self):
+        atlas = FakeAtlas()
+        self.cache.budget = 0
+        self.cache.add(atlas, "a", FakeTexture())
+        self.assertEqual([], atlas.unloaded)
+        self.cache.add(atlas, "b", FakeTexture())
+        self.assertEqual(["a"], atlas.unloaded)
+        self.assertEqual([(atlas, "b")], list(self.cache.pages))
+
+    def test_sprite_with_no_budget(self):
+        page_cache.set_budget(0)
+        try:
+            self.assertIsInstance(Icarus(PATH)['4'], Sprite)
+        finally:
+            page_cache.set_budget(512)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from MysteryOnline.location import LocationManager
+
+
+class LocationIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.locations = os.path.join(self.folder, "locations")
+        self.index_file = os.path.join(self.folder, "index.json")
+        os.makedirs(os.path.join(self.locations, "Hakuryou"))
+        for file in ("Aqua1.png", "Aqua1_foreground.png", "Hallway.jpg"):
+            open(os.path.join(self.locations, "Hakuryou", file), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def load(self):
+        manager = LocationManager(self.locations, self.index_file)
+        manager.load_locations()
+        return manager.locations["Hakuryou"]
+
+    def test_foregrounds_are_found(self):
+        location = self.load()
+        self.assertEqual(["Aqua1", "Hallway"], location.list_sub())
+        self.assertTrue(location.get_sub("Aqua1").has_foreground())
+        self.assertFalse(location.get_sub("Hallway").has_foreground())
+
+    def test_unchanged_folder_comes_from_the_index(self):
+        self.load()
+        folder = os.path.join(self.locations, "Hakuryou")
+        stat = os.stat(folder)
+        os.remove(os.path.join(folder, "Aqua1_foreground.png"))
+        os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertTrue(self.load().get_sub("Aqua1").has_foreground())
+        open(os.path.join(folder, "Roof.png"), 'w').close()
+        os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        location = self.load()
+        self.assertIn("Roof", location.list_sub())
+        self.assertFalse(location.get_sub("Aqua1").has_foreground())
+
+    def test_refresh_keeps_unchanged_sublocations(self):
+        manager = LocationManager(self.locations, self.index_file)
+        manager.load_locations()
+        location = manager.locations["Hakuryou"]
+        aqua = location.get_sub("Aqua1")
+        self.assertEqual(set(), manager.refresh())
+        folder = os.path.join(self.locations, "Hakuryou")
+        open(os.path.join(folder, "Roof.png"), 'w').close()
+        stat = os.stat(folder)
+        os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual({"Hakuryou"}, manager.refresh())
+        self.assertIs(location, manager.locations["Hakuryou"])
+        self.assertIs(aqua, location.get_sub("Aqua1"))
+        self.assertIn("Roof", location.list_sub())
+
+
+if __name__ == '__main__':
+    unittest.main()
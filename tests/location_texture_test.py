@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from MysteryOnline.location import TextureCache
+
+
+class TextureCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        for name in ("Aqua1", "Aqua2", "Hallway"):
+            path = os.path.join(self.folder, name + ".png")
+            Image.new('RGBA', (8, 4)).save(path)
+            self.paths.append(path)
+        self.cache = TextureCache(capacity=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_texture_is_loaded_once(self):
+        texture = self.cache.get(self.paths[0])
+        self.assertEqual((8, 4), texture.size)
+        self.assertIs(texture, self.cache.get(self.paths[0]))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.get(self.paths[0])
+        self.cache.get(self.paths[1])
+        self.cache.get(self.paths[0])
+        self.cache.get(self.paths[2])
+        self.assertEqual([self.paths[0], self.paths[2]], list(self.cache.textures))
+
+    def test_missing_file(self):
+        self.assertIsNone(self.cache.get(os.path.join(self.folder, "Missing.png")))
+        self.assertEqual({}, dict(self.cache.textures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from MysteryOnline.irc_mo import MessageFactory, IncorrectMessageTypeError, ChatMessage, IconMessage, \
+    CharacterMessage, OOCMessage, LOOCMessage, MusicMessage, ItemMessage, ChoiceReturnMessage
+
+
+class MessageFactoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = MessageFactory()
+
+    def test_chat_message(self):
+        msg = self.factory.build_from_irc("Hakuryou#Aqua1#RedHerring#3#center#0#1#0#Hello #1", "Test")
+        self.assertIsInstance(msg, ChatMessage)
+        self.assertEqual("Test", msg.sender)
+        self.assertEqual("Aqua1", msg.sublocation)
+        self.assertIsNone(msg.sfx_name)
+        self.assertEqual("Hello #1", msg.content)
+
+    def test_icon_message_without_dance(self):
+        msg = self.factory.build_from_irc("sc#Hakuryou#Aqua1#RedHerring#3#left#0", "Test")
+        self.assertIsInstance(msg, IconMessage)
+        self.assertEqual("left", msg.position)
+        self.assertFalse(msg.dance)
+
+    def test_icon_message_with_dance(self):
+        msg = self.factory.build_from_irc("sc#Hakuryou#Aqua1#RedHerring#3#left#0#True", "Test")
+        self.assertEqual("True", msg.dance)
+
+    def test_optional_fields(self):
+        msg = self.factory.build_from_irc("c#RedHerring", "Test")
+        self.assertIsInstance(msg, CharacterMessage)
+        self.assertEqual("RedHerring", msg.character)
+        self.assertEqual('', msg.version)
+        msg = self.factory.build_from_irc("m#stop", "Test")
+        self.assertIsInstance(msg, MusicMessage)
+        self.assertIsNone(msg.url)
+
+    def test_ooc_content_may_contain_separators(self):
+        msg = self.factory.build_from_irc("OOC#a#b#c#d#e#f#g#h#i", "Test")
+        self.assertIsInstance(msg, OOCMessage)
+        self.assertEqual("a#b#c#d#e#f#g#h#i", msg.content)
+
+    def test_last_field_keeps_separators(self):
+        msg = self.factory.build_from_irc("i#Knife#A knife#Sharp#Test", "Test")
+        self.assertIsInstance(msg, ItemMessage)
+        self.assertEqual("Knife#A knife#Sharp#Test", msg.item)
+        msg = self.factory.build_from_irc("ch2#Test#False#yes#no", "Test")
+        self.assertIsInstance(msg, ChoiceReturnMessage)
+        self.assertEqual("yes#no", msg.selected_option)
+
+    def test_plain_text_is_ooc(self):
+        msg = self.factory.build_from_irc("hello there", "Test")
+        self.assertIsInstance(msg, OOCMessage)
+        self.assertEqual("hello there", msg.content)
+
+    def test_malformed_messages(self):
+        for irc_message in ("LOOC#Hakuryou", "sc#Hakuryou#Aqua1", "ch#Text#Options", "hello #there"):
+            with self.assertRaises(IncorrectMessageTypeError):
+                self.factory.build_from_irc(irc_message, "Test")
+
+    def test_round_trip(self):
+        msg = self.factory.build_looc_message("Hakuryou", "hi#there")
+        result = self.factory.build_from_irc(msg.to_irc(), "Test")
+        self.assertIsInstance(result, LOOCMessage)
+        self.assertEqual("Hakuryou", result.location)
+        self.assertEqual("hi#there", result.content)
+
+    def test_messages_are_slotted(self):
+        for message_type in list(self.factory.message_types.values()) + [ChatMessage]:
+            self.assertFalse(hasattr(message_type("Test"), '__dict__'), message_type.__name__)
+
+    def test_to_irc(self):
+        msg = self.factory.build_chat_message(content="hi", location="Hakuryou", sublocation="Aqua1",
+                                              character="RedHerring", sprite="3", position="center", color_id=0,
+                                              sprite_option=1, sfx_name=None)
+        self.assertEqual("Hakuryou#Aqua1#RedHerring#3#center#0#1#0#hi", msg.to_irc())
+        self.assertEqual("m#0#0", self.factory.build_music_message(None, None).to_irc())
+        self.assertEqual("c#RedHerring#None#None", self.factory.build_character_message("RedHerring").to_irc())
+
+    def test_from_irc(self):
+        msg = IconMessage.from_irc("sc#Hakuryou#Aqua1#RedHerring#3#left#0#True", "Test")
+        self.assertEqual("Test", msg.sender)
+        self.assertEqual("sc#Hakuryou#Aqua1#RedHerring#3#left#0#True", msg.to_irc())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from MysteryOnline.irc_mo import MessageQueue, PrivateMessageQueue
+
+
+class MessageQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = MessageQueue(capacity=3)
+
+    def test_first_in_first_out(self):
+        self.queue.enqueue("1")
+        self.queue.enqueue("2")
+        self.assertEqual("1", self.queue.dequeue())
+        self.assertEqual("2", self.queue.dequeue())
+        self.assertIsNone(self.queue.dequeue())
+        self.assertTrue(self.queue.is_empty())
+
+    def test_push_front(self):
+        self.queue.enqueue("1")
+        self.queue.enqueue("2")
+        first = self.queue.dequeue()
+        self.queue.push_front(first)
+        self.assertEqual("1", self.queue.dequeue())
+
+    def test_priority_lane_drained_first(self):
+        self.queue.enqueue("remote")
+        self.queue.enqueue_priority("local")
+        self.assertEqual(2, self.queue.size())
+        self.assertEqual("local", self.queue.dequeue())
+        self.assertEqual("remote", self.queue.dequeue())
+
+    def test_overflow_drops_oldest(self):
+        for msg in ("1", "2", "3", "4", "5"):
+            self.queue.enqueue(msg)
+        self.assertEqual(3, self.queue.size())
+        self.assertEqual(2, self.queue.dropped)
+        self.assertEqual("3", self.queue.dequeue())
+
+
+class PrivateMessageQueueTests(unittest.TestCase):
+
+    def test_first_in_first_out(self):
+        queue = PrivateMessageQueue(capacity=2)
+        queue.enqueue("hello", "Test")
+        queue.enqueue("there", "Test")
+        queue.enqueue("friend", "Test")
+        self.assertEqual(1, queue.dropped)
+        self.assertEqual("there", queue.dequeue().msg)
+        self.assertEqual("friend", queue.dequeue().msg)
+        self.assertIsNone(queue.dequeue())
+
+
+if __name__ == '__main__':
+    unittest.main()
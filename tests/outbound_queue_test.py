@@ -0,0 +1,66 @@
+import unittest
+from MysteryOnline.irc_mo import OutboundQueue
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class OutboundQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.queue = OutboundQueue(rate=0.5, burst=2, clock=self.clock)
+
+    def test_burst_then_throttle(self):
+        for msg in ("1", "2", "3"):
+            self.queue.push("#mo", msg)
+        self.assertEqual(("#mo", "1"), self.queue.pop())
+        self.assertEqual(("#mo", "2"), self.queue.pop())
+        self.assertIsNone(self.queue.pop())
+        self.clock.now = 2.0
+        self.assertEqual(("#mo", "3"), self.queue.pop())
+        self.assertEqual(2.0, self.queue.throttled)
+        self.assertEqual(0, self.queue.size())
+
+    def test_priorities(self):
+        self.queue.push("#mo", "presence", OutboundQueue.PRESENCE)
+        self.queue.push("#mo", "icon", OutboundQueue.ICON)
+        self.queue.push("#mo", "chat", OutboundQueue.CHAT)
+        self.assertEqual(("#mo", "chat"), self.queue.pop())
+        self.assertEqual(("#mo", "icon"), self.queue.pop())
+
+    def test_keyed_lines_are_merged(self):
+        self.queue.push("#mo", "l#Hakuryou", OutboundQueue.PRESENCE, 'l')
+        self.queue.push("#mo", "c#RedHerring", OutboundQueue.PRESENCE, 'c')
+        self.queue.push("#mo", "l#Elsewhere", OutboundQueue.PRESENCE, 'l')
+        self.assertEqual(2, self.queue.size())
+        self.assertEqual(1, self.queue.merged)
+        self.assertEqual(("#mo", "l#Elsewhere"), self.queue.pop())
+        self.assertEqual(("#mo", "c#RedHerring"), self.queue.pop())
+        self.queue.push("#mo", "l#Hakuryou", OutboundQueue.PRESENCE, 'l')
+        self.assertEqual(1, self.queue.size())
+
+
+    def test_state_lines_keep_their_order_across_lanes(self):
+        self.queue.push("#mo", "l#Old", OutboundQueue.PRESENCE, 'l', state=True)
+        self.queue.push("#mo", "sc#Hakuryou#Aqua1", OutboundQueue.ICON, state=True)
+        self.queue.push("#mo", "m#Track", OutboundQueue.ICON)
+        self.queue.push("#mo", "OOC#hi", OutboundQueue.CHAT)
+        self.queue.push("#mo", "Hakuryou#Roof#hello", OutboundQueue.CHAT, state=True)
+        self.queue.push("#mo", "l#New", OutboundQueue.PRESENCE, 'l', state=True)
+        sent = []
+        while self.queue.size():
+            self.clock.now += 2.0
+            sent.append(self.queue.pop()[1])
+        self.assertEqual(["OOC#hi", "l#Old", "sc#Hakuryou#Aqua1", "Hakuryou#Roof#hello", "m#Track", "l#New"], sent)
+        self.assertEqual(0, self.queue.merged)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from MysteryOnline.character import characters
+from MysteryOnline.location import Location
+from MysteryOnline.prefetcher import SpritePrefetcher
+from MysteryOnline.user import User
+
+
+class SpritePrefetcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.here = Location("Here")
+        self.elsewhere = Location("Elsewhere")
+
+    def make_user(self, name, location, *sprites):
+        user = User(name)
+        user.set_char(characters['RedHerring'])
+        user.location = location
+        for sprite in sprites:
+            user.set_current_sprite(sprite)
+        return user
+
+    def test_recent_sprites(self):
+        user = self.make_user("Test", self.here, "1", "2", "3", "2")
+        self.assertEqual("2", user.current_sprite)
+        self.assertEqual(["3", "1"], user.recent_sprites)
+
+    def test_only_users_in_location(self):
+        here = self.make_user("Here", self.here, "1", "2")
+        elsewhere = self.make_user("Elsewhere", self.elsewhere, "3")
+        wanted = SpritePrefetcher.get_wanted_sprites([here, elsewhere], self.here)
+        self.assertEqual([(characters['RedHerring'], "2"), (characters['RedHerring'], "1")], wanted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from MysteryOnline.irc_mo import PresenceDebouncer, LocationMessage, CharacterMessage, IconMessage
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PresenceDebouncerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.debouncer = PresenceDebouncer(window=2.0, clock=self.clock)
+
+    def test_joins_in_the_window_share_one_answer(self):
+        delay = self.debouncer.join()
+        self.assertTrue(2.0 <= delay <= 3.0)
+        self.clock.now = 1.0
+        self.assertIsNone(self.debouncer.join())
+        self.assertIsNone(self.debouncer.join())
+        self.assertTrue(self.debouncer.is_due())
+        self.assertIsNotNone(self.debouncer.join())
+
+    def test_skipped_when_state_went_out_after_the_join(self):
+        self.debouncer.join()
+        self.clock.now = 1.0
+        self.debouncer.sent(LocationMessage("default", "Hakuryou"))
+        self.debouncer.sent(CharacterMessage("default", "RedHerring"))
+        self.debouncer.sent(IconMessage("default", sprite="4"))
+        self.assertFalse(self.debouncer.is_due())
+
+    def test_partial_state_is_not_enough(self):
+        self.debouncer.join()
+        self.clock.now = 1.0
+        self.debouncer.sent(IconMessage("default", sprite="4"))
+        self.assertTrue(self.debouncer.is_due())
+
+    def test_state_sent_before_the_join_is_stale(self):
+        self.debouncer.sent(LocationMessage("default", "Hakuryou"))
+        self.debouncer.sent(CharacterMessage("default", "RedHerring"))
+        self.debouncer.sent(IconMessage("default", sprite="4"))
+        self.clock.now = 1.0
+        self.debouncer.join()
+        self.assertTrue(self.debouncer.is_due())
+
+
+if __name__ == '__main__':
+    unittest.main()
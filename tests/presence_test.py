@@ -0,0 +1,44 @@
+import unittest
+from MysteryOnline.location import Location, SubLocation
+from MysteryOnline.user import PresenceIndex, User, presence
+
+
+class PresenceIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.presence = PresenceIndex()
+
+    def test_moving_between_rooms(self):
+        self.presence.move("Alice", "Hakuryou", "Aqua1")
+        self.presence.move("Bob", "Hakuryou", "Hallway")
+        self.assertTrue(self.presence.in_same_location("Alice", "Bob"))
+        self.assertEqual(["Alice"], self.presence.get_sublocation_users("Hakuryou", "Aqua1"))
+        self.presence.move("Alice", "Elsewhere", "Roof")
+        self.assertFalse(self.presence.in_same_location("Alice", "Bob"))
+        self.assertEqual(["Bob"], self.presence.get_location_users("Hakuryou"))
+        self.assertEqual([], self.presence.get_sublocation_users("Hakuryou", "Aqua1"))
+
+    def test_removed_user_is_nowhere(self):
+        self.presence.move("Alice", "Hakuryou", "Aqua1")
+        self.presence.remove("Alice")
+        self.presence.remove("Alice")
+        self.assertIsNone(self.presence.get_loc_name("Alice"))
+        self.assertFalse(self.presence.in_same_location("Alice", "Alice"))
+        self.assertEqual({}, self.presence.locations)
+
+
+class UserPresenceTests(unittest.TestCase):
+
+    def test_set_loc_updates_the_index(self):
+        location = Location("Hakuryou")
+        location.sublocations["Aqua1"] = SubLocation("Aqua1", "Aqua1.png")
+        user = User("Test")
+        user.location = location
+        user.set_subloc(location.get_sub("Aqua1"))
+        self.assertEqual("Hakuryou", presence.get_loc_name(user))
+        self.assertIn(user, presence.get_sublocation_users("Hakuryou", "Aqua1"))
+        presence.remove(user)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -57,6 +57,32 @@ class SubLocationTests(unittest.TestCase):
         self.sublocation.remove_r_user(user)
         self.assertEqual([], self.sublocation.r_users)
 
+    def test_user_takes_one_slot(self):
+        user = MockUser("Test")
+        other = MockUser("Other")
+        self.sublocation.add_r_user(user)
+        self.sublocation.add_r_user(other)
+        self.sublocation.add_l_user(user)
+        self.assertEqual([other], self.sublocation.r_users)
+        self.assertIs(user, self.sublocation.get_l_user())
+        self.sublocation.remove_r_user(user)
+        self.assertIs(user, self.sublocation.get_l_user())
+        self.assertTrue(self.sublocation.is_consistent())
+
+    def test_speaking_again_moves_to_the_top(self):
+        user = MockUser("Test")
+        other = MockUser("Other")
+        self.sublocation.add_c_user(user)
+        self.sublocation.add_c_user(other)
+        self.sublocation.add_c_user(user)
+        self.assertEqual([other, user], self.sublocation.c_users)
+        self.sublocation.remove_c_user(user)
+        self.assertIs(other, self.sublocation.get_c_user())
+        self.sublocation.remove_c_user(other)
+        self.assertIsNone(self.sublocation.get_c_user())
+        self.assertEqual([], self.sublocation.get_users())
+        self.assertTrue(self.sublocation.is_consistent())
+
 
 if __name__ == '__main__':
     unittest.main()
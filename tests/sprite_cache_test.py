@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from kivy.core.image import Image as CoreImage
+from kivy.graphics.texture import Texture
+from MysteryOnline import sprite_cache
+
+PAGE = "characters/RedHerring/sprites-0.png"
+ATLAS = "characters/RedHerring/sprites.atlas"
+
+
+class SpriteCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = os.path.join(self.folder, "cache")
+        self.page = os.path.join(self.folder, "sprites-0.png")
+        shutil.copy(PAGE, self.page)
+        self.cache_path = sprite_cache.get_cache_path(self.page, self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load_builds_then_maps(self):
+        built = sprite_cache.load(self.page, self.cache)
+        self.assertTrue(sprite_cache.is_fresh(self.page, self.cache_path))
+        mapped = sprite_cache.load(self.page, self.cache)
+        self.assertEqual((built.width, built.height), (mapped.width, mapped.height))
+        self.assertEqual(bytes(built.data), bytes(mapped.data))
+
+    def test_touched_page_stays_fresh(self):
+        sprite_cache.load(self.page, self.cache)
+        stat = os.stat(self.page)
+        os.utime(self.page, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertTrue(sprite_cache.is_fresh(self.page, self.cache_path))
+        self.assertEqual(stat.st_mtime_ns + 10 ** 9, sprite_cache.read_header(self.cache_path)[4])
+
+    def test_changed_page_is_rebuilt(self):
+        sprite_cache.load(self.page, self.cache)
+        with open(self.page, 'ab') as f:
+            f.write(b'\0')
+        self.assertFalse(sprite_cache.is_fresh(self.page, self.cache_path))
+
+    def test_regions_match_core_image(self):
+        with open(ATLAS, 'r') as fd:
+            regions = json.load(fd)[os.path.basename(PAGE)]
+        expected = CoreImage(PAGE).texture
+        for _ in range(2):
+            # Once from the PNG, once from the mapped copy
+            texture = Texture.create_from_data(sprite_cache.load(self.page, self.cache))
+            for name, region in regions.items():
+                self.assertEqual(expected.get_region(*region).pixels, texture.get_region(*region).pixels, name)
+
+    def test_prune_removes_orphans(self):
+        sprite_cache.load(self.page, self.cache)
+        with open(self.cache_path + ".tmp", 'wb') as f:
+            f.write(b'unfinished')
+        sprite_cache.prune(self.cache)
+        self.assertEqual([os.path.basename(self.cache_path)], os.listdir(self.cache))
+        os.remove(self.page)
+        sprite_cache.prune(self.cache)
+        self.assertEqual([], os.listdir(self.cache))
+
+    def test_trim_keeps_within_budget(self):
+        other = os.path.join(self.folder, "sprites-1.png")
+        shutil.copy(PAGE, other)
+        sprite_cache.load(self.page, self.cache)
+        size = os.path.getsize(self.cache_path)
+        old_budget = sprite_cache.budget
+        sprite_cache.budget = size
+        try:
+            sprite_cache.load(other, self.cache)
+        finally:
+            sprite_cache.budget = old_budget
+        self.assertEqual([os.path.basename(sprite_cache.get_cache_path(other, self.cache))], os.listdir(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 import unittest
+from kivy.graphics.texture import Texture
+from kivy.uix.image import Image
+from MysteryOnline.sprite import Sprite, SpriteLayer, CG
 from MysteryOnline.sprite_organizer import SpriteOrganizer
 
 
@@ -43,5 +46,60 @@ class SpriteTest(unittest.TestCase):
         self.assertIs(ms2, self.so.get_sprites()[2])
 
 
+class SpriteTextureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.texture = Texture.create(size=(100, 100)).get_region(10, 20, 30, 40)
+        self.sprite = Sprite("1", self.texture)
+
+    def test_flipped_variant_is_cached(self):
+        flipped = self.sprite.get_texture(True)
+        self.assertIs(flipped, self.sprite.get_texture(True))
+        self.assertIs(self.texture, self.sprite.get_texture())
+
+    def test_flipping_leaves_the_texture_alone(self):
+        coords = self.texture.tex_coords
+        flipped = self.sprite.get_texture(True)
+        self.assertEqual(coords, self.texture.tex_coords)
+        self.assertAlmostEqual(coords[0], flipped.tex_coords[2])
+        self.assertAlmostEqual(coords[2], flipped.tex_coords[0])
+
+    def test_display_class_change_drops_the_resolved_texture(self):
+        self.sprite.get_texture()
+        self.sprite.display_textures[False] = None
+        self.sprite.set_cg()
+        self.assertTrue(self.sprite.is_cg())
+        self.assertIs(self.texture, self.sprite.get_texture())
+        self.sprite.set_display_class(CG)
+        self.assertIn(False, self.sprite.display_textures)
+        self.sprite.unset_nsfw()
+        self.assertTrue(self.sprite.is_cg())
+
+
+class SpriteLayerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = Image(opacity=0)
+        self.layer = SpriteLayer(self.image)
+        self.texture = Texture.create(size=(30, 40))
+
+    def test_same_frame_is_not_redrawn(self):
+        self.layer.show("key", self.texture, (30, 40))
+        self.assertEqual(1, self.image.opacity)
+        self.image.size = (1, 1)
+        self.layer.show("key", self.texture, (30, 40))
+        self.assertEqual([1, 1], self.image.size)
+        self.layer.show("other", self.texture, (30, 40))
+        self.assertEqual([30, 40], self.image.size)
+
+    def test_hide(self):
+        self.layer.show("key", self.texture, (30, 40))
+        self.layer.hide()
+        self.assertEqual(0, self.image.opacity)
+        self.assertIsNone(self.image.texture)
+        self.layer.show("key", self.texture, (30, 40))
+        self.assertIs(self.texture, self.image.texture)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from types import SimpleNamespace
+from MysteryOnline.textbox import TextBox, Typewriter, get_cutoffs
+
+
+class CutoffTests(unittest.TestCase):
+
+    def test_entities_are_not_split(self):
+        self.assertEqual([1, 5, 6], get_cutoffs("a&bl;b"))
+
+    def test_tags_go_with_the_next_character(self):
+        text = "[b]hi[/b]"
+        self.assertEqual(["[b]h", "[b]hi[/b]"], [text[:cutoff] for cutoff in get_cutoffs(text)])
+
+    def test_empty(self):
+        self.assertEqual([], get_cutoffs(""))
+
+
+class TypewriterTests(unittest.TestCase):
+
+    def test_several_characters_per_tick(self):
+        typewriter = Typewriter("Hello there", speed=240)
+        text, blip = typewriter.advance(1 / 60)
+        self.assertEqual("Hell", text)
+        self.assertTrue(blip)
+        self.assertFalse(typewriter.is_done())
+        text, blip = typewriter.advance(1)
+        self.assertEqual("Hello there", text)
+        self.assertTrue(typewriter.is_done())
+
+    def test_nothing_new_to_show(self):
+        typewriter = Typewriter("Hi", speed=10)
+        self.assertEqual((None, False), typewriter.advance(0.05))
+        self.assertEqual(("H", True), typewriter.advance(0.05))
+
+    def test_blips_have_their_own_cadence(self):
+        typewriter = Typewriter("x" * 100, speed=100, blip_interval=0.05)
+        blips = sum(typewriter.advance(0.01)[1] for _ in range(100))
+        self.assertTrue(typewriter.is_done())
+        self.assertLessEqual(blips, 21)
+        self.assertGreaterEqual(blips, 19)
+
+
+class FakeEvent:
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ClearTextboxTests(unittest.TestCase):
+
+    def test_clear_while_typing(self):
+        event = FakeEvent()
+        box = SimpleNamespace(text="Earlier line Hel", typed_base="Earlier line ", typewriter=Typewriter("Hello", 60),
+                              typewriter_event=event, is_displaying_msg=True)
+        TextBox.clear_textbox(box)
+        self.assertTrue(event.cancelled)
+        self.assertEqual("", box.text)
+        self.assertEqual("", box.typed_base)
+        self.assertIsNone(box.typewriter)
+        self.assertIsNone(box.typewriter_event)
+        self.assertFalse(box.is_displaying_msg)
+
+
+if __name__ == '__main__':
+    unittest.main()